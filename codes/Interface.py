@@ -5,8 +5,7 @@ import os
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from diarNS import run_diarization
-from mypredict_imp import predict_speaker_count
+from diarNS import diarize_file
 import wave
 import contextlib
 from tkinter import font as tkfont
@@ -221,13 +220,9 @@ class ModernInterface:
     
     def process_audio(self, file_path):
         try:
-            self.show_loading("Predicting speaker count...")
-            
-            num_speakers = predict_speaker_count(file_path)
-            
-            self.show_loading(f"Running diarization for {num_speakers} speakers...")
-            
-            run_diarization(num_speakers, file_path)
+            # same pipeline as main.py: speech pre-pass, cascaded count, diarization
+            record, _ = diarize_file(file_path, progress=self.show_loading)
+            num_speakers = record['count']
             
             self.analyze_results(file_path, num_speakers)
             
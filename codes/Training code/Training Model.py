@@ -1,8 +1,8 @@
 import numpy as np
 import soundfile as sf
-import librosa
 import math
 import os
+import sys
 from sklearn.model_selection import train_test_split
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import (Conv2D, MaxPooling2D, BatchNormalization,
@@ -14,6 +14,11 @@ from tensorflow.keras.utils import to_categorical, Sequence
 from tensorflow.keras.callbacks import ModelCheckpoint
 import tensorflow as tf
 
+# Shared feature code lives one level up, next to the inference scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from melspec import get_engine
+from resampling import resample
+
 # Configuration
 tf.keras.backend.set_floatx('float32')
 SAMPLE_RATE = 16000
@@ -24,26 +29,24 @@ FRAME_LENGTH = int(SAMPLE_RATE * DURATION)
 N_MELS = 64
 
 def load_audio(path):
-    audio, sr = sf.read(path)
+    with sf.SoundFile(path) as f:
+        sr = f.samplerate
+        # decode only the training window (+ resampling margin), not the whole file
+        audio = f.read(frames=int(np.ceil(FRAME_LENGTH * sr / SAMPLE_RATE)) + sr // 10)
     audio = np.mean(audio, axis=1) if audio.ndim > 1 else audio
     if sr != SAMPLE_RATE:
-        audio = librosa.resample(audio, orig_sr=sr, target_sr=SAMPLE_RATE)
+        audio = resample(audio, sr, SAMPLE_RATE)
     if len(audio) < FRAME_LENGTH:
         audio = np.pad(audio, (0, FRAME_LENGTH - len(audio)), 'constant')
     return audio[:FRAME_LENGTH].astype('float32')
 
 def create_mel_spectrogram(audio):
-    mel_spec = librosa.feature.melspectrogram(
-        y=audio,
-        sr=SAMPLE_RATE,
-        n_fft=N_FFT,
-        hop_length=HOP_LENGTH,
-        n_mels=N_MELS,
-        power=2,
-        fmax=8000
-    )
-    spec_db = librosa.power_to_db(mel_spec, top_db=80)  
-    return spec_db.T.astype('float32')
+    return create_mel_batch(np.asarray(audio)[np.newaxis, :])[0]
+
+def create_mel_batch(audios):
+    # (batch, time, mels) in dB, same features as librosa melspectrogram + power_to_db(top_db=80)
+    engine = get_engine(SAMPLE_RATE, N_FFT, HOP_LENGTH, N_MELS, fmax=8000, top_db=80)
+    return engine(audios)
 
 class AudioGenerator(Sequence):
     def __init__(self, file_list, batch_size=32, shuffle=True):
@@ -60,16 +63,21 @@ class AudioGenerator(Sequence):
         X = np.zeros((len(batch_files), *SPEC_SHAPE, 1))
         y = np.zeros((len(batch_files), 5))
         
+        audios = np.zeros((len(batch_files), FRAME_LENGTH), dtype='float32')
+        loaded = []
         for i, (path, label) in enumerate(batch_files):
             try:
-                audio = load_audio(path)
-                spec = create_mel_spectrogram(audio)
-                X[i] = spec[..., np.newaxis]  # Add channel dimension
+                audios[i] = load_audio(path)
                 y[i] = to_categorical(int(label)-1, num_classes=5)
+                loaded.append(i)
             except Exception as e:
                 print(f"Error processing {path}: {e}")
                 continue
-                
+
+        # One batched Mel pass for every file that loaded
+        if loaded:
+            X[loaded] = create_mel_batch(audios[loaded])[..., np.newaxis]  # Add channel dimension
+
         return X, y
     
     def on_epoch_end(self):
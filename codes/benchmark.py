@@ -0,0 +1,304 @@
+import os
+import sys
+import json
+import time
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import numpy as np
+import soundfile as sf
+from resemblyzer import VoiceEncoder
+from spectralcluster import SpectralClusterer, RefinementOptions
+from tensorflow.keras.models import load_model
+
+from mypredict_imp import load_audio, extract_mel, count
+from diarization import create_labelling, del_sub_dir, load_wav, trim_silences
+from diarNS import write_outputs, write_outputs_mapped
+from wavmap import WavMap
+
+# ===== Benchmark parameters =====
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Examples')
+EXAMPLE_FILES = ['Test_4.wav', 'Test_5.wav']
+TILED_MINUTES = [1, 10, 60]
+DEFAULT_TOLERANCE = 0.25  # allowed relative slowdown before a stage counts as a regression
+MIN_DELTA = 0.05          # seconds; ignore regressions smaller than this (timer noise)
+MAX_CLUSTER_PARTIALS = 5000  # SpectralClusterer builds dense n x n matrices; cluster a subsample above this
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _proc_status_mb(key):
+    """
+    A VmXXX field of /proc/self/status in MB, or None where there is no procfs.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(key + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def rss_mb():
+    """
+    Current resident set size in MB (None if unknown).
+    """
+    current = _proc_status_mb('VmRSS')
+    if current is None:
+        try:
+            import psutil
+            current = psutil.Process().memory_info().rss / (1024 * 1024)
+        except ImportError:
+            pass
+    return current
+
+
+def peak_rss_mb():
+    """
+    Resident set size high-water mark in MB (None if unknown). Per stage on Linux,
+    where reset_peak_rss() clears it; otherwise for the whole benchmark process.
+    """
+    peak = _proc_status_mb('VmHWM')
+    if peak is not None:
+        return peak
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def reset_peak_rss():
+    """
+    Reset the kernel's RSS high-water mark to the current RSS (Linux only).
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+class StageFailed(Exception):
+    pass
+
+
+def measure(stages, name, func, *args, **kwargs):
+    """
+    Run func once, store wall time, CPU time and RSS high-water mark under stages[name],
+    and return the function result. A failure is recorded under stages[name] and
+    raised as StageFailed so the caller can stop that input and keep the others.
+    """
+    reset_peak_rss()
+    rss_before = rss_mb()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        result = func(*args, **kwargs)
+    except Exception as e:
+        stages[name] = {'error': f'{type(e).__name__}: {e}'}
+        raise StageFailed(name) from e
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    peak = peak_rss_mb()
+    stages[name] = {
+        'wall_s': round(wall, 4),
+        'cpu_s': round(cpu, 4),
+        'peak_rss_mb': None if peak is None else round(peak, 1),
+        'rss_growth_mb': None if peak is None or rss_before is None else round(peak - rss_before, 1),
+    }
+    return result
+
+
+def make_tiled(src_path, minutes, out_dir):
+    """
+    Tile an example recording until it lasts the requested number of minutes
+    and save it next to the other benchmark inputs.
+    """
+    audio, sr = sf.read(src_path)
+    target = int(minutes * 60 * sr)
+    reps = int(np.ceil(target / len(audio)))
+    tiled = np.tile(audio, (reps,) + (1,) * (audio.ndim - 1))[:target]
+    name = f'{os.path.splitext(os.path.basename(src_path))[0]}_{minutes}min.wav'
+    out_path = os.path.join(out_dir, name)
+    sf.write(out_path, tiled, sr, 'PCM_16')
+    return out_path
+
+
+def make_clusterer(spk_num):
+    return SpectralClusterer(
+        min_clusters=spk_num,
+        max_clusters=spk_num,
+        refinement_options=RefinementOptions(gaussian_blur_sigma=1, p_percentile=0.5)
+    )
+
+
+def subsample_labels(cont_embeds, spk_num, max_partials=MAX_CLUSTER_PARTIALS):
+    """
+    Stand-in labels for inputs too long to cluster: cluster an evenly spaced
+    subsample and give every partial the label of the nearest subsample centroid.
+    """
+    step = int(np.ceil(len(cont_embeds) / max_partials))
+    sample = cont_embeds[::step]
+    sample_labels = make_clusterer(spk_num).predict(sample)
+    names = np.unique(sample_labels)
+    centroids = np.stack([sample[sample_labels == name].mean(axis=0) for name in names])
+    centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+    return names[np.argmax(cont_embeds @ centroids.T, axis=1)]
+
+
+def bench_file(path, spk_num, encoder, model, work_dir):
+    """
+    Run every pipeline stage separately on one file and return the per-stage measurements.
+    """
+    stages = {}
+    result = {'stages': stages}
+    try:
+        _bench_stages(result, path, spk_num, encoder, model, work_dir)
+    except StageFailed as e:
+        result['failed_stage'] = str(e)
+    return result
+
+
+def _bench_stages(result, path, spk_num, encoder, model, work_dir):
+    stages = result['stages']
+    sr = sf.info(path).samplerate
+    audio = measure(stages, 'decode', load_wav, path)
+    duration = len(audio) / 16000
+    result.update(duration_s=round(duration, 2), sample_rate=sr)
+
+    counting_audio = load_audio(path)
+    mel = measure(stages, 'mel', extract_mel, counting_audio)
+    result['mel_frames'] = int(mel.shape[0])
+    if model is not None:
+        spk_num = int(measure(stages, 'count', count, counting_audio, model))
+
+    wav, runs = measure(stages, 'vad', trim_silences, audio)
+    _, cont_embeds, wav_splits = measure(
+        stages, 'embed_utterance', encoder.embed_utterance,
+        wav, return_partials=True, rate=16, min_coverage=0.75
+    )
+    result.update(embeddings=int(len(cont_embeds)), speakers=spk_num)
+    if len(cont_embeds) > MAX_CLUSTER_PARTIALS:
+        # full clustering would not fit in memory; later stages still run on stand-in labels
+        stages['cluster'] = {'skipped': f'{len(cont_embeds)} partials > {MAX_CLUSTER_PARTIALS}'}
+        labels = measure(stages, 'cluster_subsample', subsample_labels, cont_embeds, spk_num)
+    else:
+        labels = measure(stages, 'cluster', make_clusterer(spk_num).predict, cont_embeds)
+    labelling = measure(stages, 'create_labelling', create_labelling, labels, wav_splits)
+
+    out_dir = os.path.join(work_dir, os.path.splitext(os.path.basename(path))[0])
+    del_sub_dir(out_dir, 'concanated')
+    del_sub_dir(out_dir, 'separated')
+    measure(stages, 'write_outputs', write_outputs, labelling, wav, spk_num, out_dir)
+
+    # what run_diarization does for uncompressed WAV input (every benchmark input)
+    del_sub_dir(out_dir, 'concanated')
+    del_sub_dir(out_dir, 'separated')
+    measure(stages, 'write_outputs_mapped',
+            lambda: write_outputs_mapped(labelling, runs, WavMap(path), spk_num, out_dir))
+
+
+def _bench_in_process(path, spk_num, model_path, work_dir):
+    """
+    Worker entry point: load the model and encoder and benchmark one input.
+    """
+    model = load_model(model_path) if os.path.exists(model_path) else None
+    return bench_file(path, spk_num, VoiceEncoder("cpu"), model, work_dir)
+
+
+def run_benchmarks(minutes=TILED_MINUTES, model_path='mymodel/speaker_model_fixed.h5', spk_num=2):
+    """
+    Benchmark the bundled Examples recordings and their tiled versions.
+    Each input runs in a fresh process so memory peaks of one input do not leak into the next.
+    The count stage is skipped (and spk_num used instead) when the model file is missing.
+    """
+    if not os.path.exists(model_path):
+        print(f"Model file {model_path} not found, skipping count stage.")
+
+    results = {}
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        inputs = []
+        for name in EXAMPLE_FILES:
+            src = os.path.join(EXAMPLES_DIR, name)
+            inputs.append(src)
+            for m in minutes:
+                inputs.append(make_tiled(src, m, work_dir))
+
+        for path in inputs:
+            key = os.path.basename(path)
+            print(f"Benchmarking {key}...")
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                try:
+                    results[key] = pool.submit(_bench_in_process, path, spk_num, model_path, work_dir).result()
+                except BrokenProcessPool:
+                    # the worker died (typically killed for running out of memory)
+                    results[key] = {'stages': {}, 'error': 'benchmark process terminated'}
+
+    return {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'inputs': results}
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare wall times against a stored baseline.
+    Returns a list of (input, stage, baseline_s, current_s) for every regression.
+    """
+    regressions = []
+    for key, entry in results['inputs'].items():
+        base_entry = baseline.get('inputs', {}).get(key)
+        if base_entry is None:
+            continue
+        for stage, stats in entry['stages'].items():
+            base_stats = base_entry['stages'].get(stage)
+            if base_stats is None or 'wall_s' not in base_stats or 'wall_s' not in stats:
+                continue  # new, failed or skipped stage
+            base, cur = base_stats['wall_s'], stats['wall_s']
+            if cur > base * (1 + tolerance) and cur - base > MIN_DELTA:
+                regressions.append((key, stage, base, cur))
+    return regressions
+
+
+# ===== Run as standalone script =====
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Per-stage benchmark of the diarization pipeline')
+    parser.add_argument('--minutes', default=','.join(str(m) for m in TILED_MINUTES),
+                        help='Comma-separated durations (minutes) of tiled inputs, empty for none')
+    parser.add_argument('--model', default='mymodel/speaker_model_fixed.h5', help='Path to model file (.h5)')
+    parser.add_argument('--speakers', type=int, default=2, help='Speaker count used when the model is missing')
+    parser.add_argument('--output', help='Write results JSON to this path')
+    parser.add_argument('--baseline', help='Baseline JSON to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed relative slowdown per stage')
+    args = parser.parse_args()
+
+    minutes = [float(m) if '.' in m else int(m) for m in args.minutes.split(',') if m]
+    results = run_benchmarks(minutes, args.model, args.speakers)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    print(report)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for key, stage, base, cur in regressions:
+            print(f"REGRESSION {key} {stage}: {base:.3f}s -> {cur:.3f}s")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline.")
@@ -0,0 +1,138 @@
+import os
+import numpy as np
+import soundfile as sf
+from functools import lru_cache
+from resemblyzer.hparams import partials_n_frames, mel_window_step
+
+from mypredict_imp import load_audio, count
+from diarization import embed_file, RATE
+import instrumentation
+
+# ===== Cascade thresholds =====
+MIN_SPEECH_SECONDS = 2.0   # less speech than this after VAD: settle as one speaker
+MIN_SPEECH_RATIO = 0.02    # or less than this share of the recording
+EIGENGAP_MIN = 20.0        # eigengap ratio lambda_k / lambda_k+1 needed to settle k
+CHEAP_MAX_SPEAKERS = 1     # counts the cheap stage may settle; larger ones go to the model
+MAX_SPEAKERS = 5           # the counting model predicts 1-5 speakers
+MAX_AFFINITY = 1000        # embeddings used for the affinity matrix (uniform subsample)
+PARTIAL_SECONDS = partials_n_frames * mel_window_step / 1000  # 1.6 s per partial
+DECIMATE_SECONDS = PARTIAL_SECONDS / 2  # hop between the partials used for the affinity
+MIN_EIGENGAP_PARTIALS = 6  # fewer decimated partials than this: leave the count to the model
+
+
+@lru_cache(maxsize=2)
+def get_model(model_path):
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model file {model_path} not found!")
+    # imported here so files settled by the cheap stages never load TensorFlow
+    from tensorflow.keras.models import load_model
+    with instrumentation.stage('load_model'):
+        return load_model(model_path)
+
+
+def affinity(embeds):
+    """
+    Cosine affinity of L2-normalised embeddings (uniform subsample above MAX_AFFINITY).
+    """
+    if len(embeds) > MAX_AFFINITY:
+        embeds = embeds[np.linspace(0, len(embeds) - 1, MAX_AFFINITY).astype(int)]
+    return embeds @ embeds.T
+
+
+def decimate(embeds, rate=RATE):
+    """
+    Keep one partial per DECIMATE_SECONDS. At rate=16 neighbouring partials
+    overlap by ~96%; their near-identical rows turn the affinity into a temporal
+    chain instead of speaker blocks.
+    """
+    return embeds[::max(1, int(round(rate * DECIMATE_SECONDS)))]
+
+
+def eigengap_ratios(embeds, max_speakers=MAX_SPEAKERS, rate=RATE):
+    """
+    lambda_k / lambda_k+1 for k = 1..max_speakers of the affinity of decimated partials.
+    """
+    A = affinity(np.asarray(decimate(embeds, rate), dtype='float64'))
+    eigenvalues = np.linalg.eigvalsh(A)[::-1]
+    n = min(max_speakers, len(eigenvalues) - 1)
+    return eigenvalues[:n] / np.maximum(eigenvalues[1:n + 1], 1e-10)
+
+
+def eigengap(embeds, max_speakers=MAX_SPEAKERS, rate=RATE, min_ratio=EIGENGAP_MIN):
+    """
+    Speaker count suggested by the eigengaps: the smallest k whose ratio reaches
+    min_ratio, else the k with the largest ratio. Returns (k, ratio).
+    """
+    ratios = eigengap_ratios(embeds, max_speakers, rate)
+    if len(ratios) == 0:
+        return 1, np.inf
+    above = np.flatnonzero(ratios >= min_ratio)
+    k = int(above[0]) if len(above) else int(np.argmax(ratios))
+    return k + 1, float(ratios[k])
+
+
+def cascade_count(file_path, embedded=None, model_path='mymodel/speaker_model_fixed.h5',
+                  min_speech_seconds=MIN_SPEECH_SECONDS, min_speech_ratio=MIN_SPEECH_RATIO,
+                  eigengap_min=EIGENGAP_MIN, cheap_max_speakers=CHEAP_MAX_SPEAKERS, encoder=None, regions=None, rate=RATE):
+    """
+    Speaker count in up to three stages:
+      1. 'vad'      - too little speech left after VAD: one speaker
+      2. 'eigengap' - an eigengap ratio >= eigengap_min at k <= cheap_max_speakers
+                      in the affinity of decimated partials
+      3. 'model'    - otherwise the CNN-LSTM counter
+    embedded is the embed_file() result (computed at `rate` partials per second);
+    it is computed if missing and returned so diarization can reuse it. regions
+    (speech_detect pre-pass) restricts both the embeddings and the model input to speech. Returns (record, embedded).
+    """
+    if embedded is None:
+        embedded = embed_file(file_path, encoder, regions, rate)
+    wav, _, cont_embeds, _ = embedded
+
+    speech_seconds = len(wav) / 16000
+    try:
+        duration = sf.info(file_path).duration
+    except RuntimeError:
+        duration = speech_seconds  # format soundfile cannot read; ratio unknown
+    record = {
+        'file': file_path,
+        'speech_seconds': round(speech_seconds, 2),
+        'speech_ratio': round(speech_seconds / duration, 3) if duration > 0 else 0.0,
+    }
+
+    if speech_seconds < min_speech_seconds or record['speech_ratio'] < min_speech_ratio:
+        record.update(count=1, stage='vad')
+        instrumentation.add('count_stage_vad')
+        return record, embedded
+
+    if cheap_max_speakers >= 1 and len(decimate(cont_embeds, rate)) >= MIN_EIGENGAP_PARTIALS:
+        with instrumentation.stage('eigengap'):
+            k, ratio = eigengap(cont_embeds, rate=rate, min_ratio=eigengap_min)
+        record['eigengap'] = {'k': k, 'ratio': round(ratio, 3)}
+        if k <= cheap_max_speakers and ratio >= eigengap_min:
+            record.update(count=k, stage='eigengap')
+            instrumentation.add('count_stage_eigengap')
+            return record, embedded
+
+    model = get_model(model_path)
+    record.update(count=int(count(load_audio(file_path, regions), model)), stage='model')
+    instrumentation.add('count_stage_model')
+    return record, embedded
+
+
+# ===== Run as standalone script =====
+if __name__ == '__main__':
+    import json
+    import argparse
+    parser = argparse.ArgumentParser(description='Cascaded speaker count (VAD / eigengap / model)')
+    parser.add_argument('audio', nargs='+', help='Audio files')
+    parser.add_argument('--model', default='mymodel/speaker_model_fixed.h5', help='Path to model file (.h5)')
+    parser.add_argument('--min-speech-seconds', type=float, default=MIN_SPEECH_SECONDS)
+    parser.add_argument('--min-speech-ratio', type=float, default=MIN_SPEECH_RATIO)
+    parser.add_argument('--eigengap-min', type=float, default=EIGENGAP_MIN)
+    parser.add_argument('--cheap-max-speakers', type=int, default=CHEAP_MAX_SPEAKERS)
+    args = parser.parse_args()
+
+    for path in args.audio:
+        record, _ = cascade_count(path, None, args.model, args.min_speech_seconds, args.min_speech_ratio,
+                                  args.eigengap_min, args.cheap_max_speakers)
+        print(json.dumps(record))
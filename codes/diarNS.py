@@ -2,14 +2,19 @@ import os
 import shutil
 import soundfile as sf
 import numpy as np
-from diarization import diar, del_sub_dir
+from diarization import (embed_file, cluster_labels, create_labelling, speaker_centroids,
+                         map_span, del_sub_dir)
+from wavmap import WavMap, WavWriter, is_uncompressed_wav
+from speech_detect import speech_regions
+from cascade import cascade_count
+import instrumentation
 
 
-def run_diarization(spk_num, file_path):
-    rootdir = os.path.dirname(file_path)  # directory containing the file
+def run_diarization(spk_num, file_path, encoder=None, rootdir=None, embedded=None, index_dir=None):
+    if rootdir is None:
+        rootdir = os.path.dirname(file_path)  # directory containing the file
     sampling_rate = 16000
-    seglen = 0
-   
+
     # Clear output folders
     delconca = os.path.join(rootdir, 'concanated')
     if os.path.exists(delconca):
@@ -22,11 +27,109 @@ def run_diarization(spk_num, file_path):
     os.makedirs(delsepa, exist_ok=True)
 
     # Process the selected file only
-    labels, wavf = diar(file_path, spk_num)
-    sf.write(os.path.join(rootdir, 'outputNoSilence.wav'), wavf, sampling_rate, 'PCM_24')
+    with instrumentation.profiled('run_diarization'):
+        # embedded: embed_file() result already computed by the caller (e.g. cascade_count)
+        if embedded is None:
+            embedded = embed_file(file_path, encoder)
+        wavf, runs, cont_embeds, wav_splits = embedded
+        labels = []
+        if len(wavf):
+            spk_labels = cluster_labels(cont_embeds, spk_num)
+            with instrumentation.stage('labelling'):
+                labels = create_labelling(spk_labels, wav_splits)
+            if index_dir is not None:
+                # keep one centroid per speaker for cross-recording search
+                from speaker_index import SpeakerIndex
+                SpeakerIndex(index_dir).add(file_path, speaker_centroids(cont_embeds, spk_labels))
+
+        # Uncompressed WAV input: copy frames straight from the memory-mapped original,
+        # unless writing the outputs would truncate the mapped file itself
+        source = None
+        if is_uncompressed_wav(file_path) and not overwrites_input(file_path, rootdir):
+            source = WavMap(file_path)
+
+        with instrumentation.stage('write', len(wavf) / sampling_rate):
+            del_sub_dir(rootdir, 'concanated')
+            del_sub_dir(rootdir, 'separated')
+
+            if source is not None:
+                write_outputs_mapped(labels, runs, source, spk_num, rootdir)
+            else:
+                sf.write(os.path.join(rootdir, 'outputNoSilence.wav'), wavf, sampling_rate, 'PCM_24')
+                write_outputs(labels, wavf, spk_num, rootdir)
+    instrumentation.flush()
+    return labels
+
+
+def diarize_file(file_path, model_path='mymodel/speaker_model_fixed.h5', encoder=None,
+                 rootdir=None, index_dir=None, progress=print):
+    """
+    The whole pipeline for one file, as run by main.py and the interface: speech
+    pre-pass, cascaded speaker count, then diarization reusing the counting
+    embeddings. progress receives a status message before each step.
+    Returns (count record, labels).
+    """
+    # Speech pre-pass: counting and embedding skip music, tones and long gaps
+    try:
+        regions, _ = speech_regions(file_path)
+    except RuntimeError:
+        regions = None  # format soundfile cannot read; process the whole file
+
+    progress("Predicting speaker count...")
+    record, embedded = cascade_count(file_path, model_path=model_path, encoder=encoder, regions=regions)
+    progress(f"Running diarization for {record['count']} speakers...")
+    labels = run_diarization(record['count'], file_path, encoder, rootdir, embedded, index_dir)
+    return record, labels
+
+
+def overwrites_input(file_path, rootdir):
+    """
+    True if file_path is one of the output files written under rootdir (e.g. a
+    re-run on a previous outputNoSilence.wav). The concanated and separated
+    folders are cleared before writing, so only outputNoSilence.wav can clash.
+    """
+    target = os.path.join(rootdir, 'outputNoSilence.wav')
+    return os.path.exists(target) and os.path.samefile(file_path, target)
 
-    del_sub_dir(rootdir, 'concanated')
-    del_sub_dir(rootdir, 'separated')
+
+def write_outputs_mapped(labels, runs, source, spk_num, rootdir):
+    """
+    Write the same outputs as write_outputs, but as block copies of the original
+    WAV frames (same format, no float conversion or re-encoding). runs maps the
+    silence-trimmed timeline of the labels back onto the original recording.
+    """
+    seglen = 0
+    scale = source.samplerate / 16000
+
+    def frame_ranges(ranges):
+        return [(int(a * scale), int(b * scale)) for a, b in ranges]
+
+    with WavWriter(os.path.join(rootdir, 'outputNoSilence.wav'), source) as out:
+        for a, b in frame_ranges(runs):
+            out.write(source.segment(a, b))
+
+    speakers = {f'spk{i}': WavWriter(os.path.join(rootdir, 'concanated', f'spk{i}.wav'), source)
+                for i in range(spk_num)}
+    try:
+        for label in labels:
+            spk_id, start, end = label
+            if (end - start) > seglen:
+                speaker_key = f'spk{spk_id}'
+                sepa_path = os.path.join(rootdir, 'separated', f'{speaker_key}_{start}.wav')
+                with WavWriter(sepa_path, source) as sepa:
+                    for a, b in frame_ranges(map_span(runs, start, end)):
+                        block = source.segment(a, b)
+                        sepa.write(block)
+                        speakers[speaker_key].write(block)
+                print(f"{speaker_key.upper()} catched...")
+    finally:
+        for writer in speakers.values():
+            writer.close()
+
+
+def write_outputs(labels, wavf, spk_num, rootdir):
+    sampling_rate = 16000
+    seglen = 0
 
     speakers = {f'spk{i}': np.array([]) for i in range(spk_num)}
 
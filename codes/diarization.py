@@ -1,8 +1,24 @@
 import os
 import shutil
-from resemblyzer import preprocess_wav, VoiceEncoder
+import numpy as np
+import webrtcvad
+import librosa
+from scipy.ndimage import binary_dilation
+from resemblyzer import VoiceEncoder
+from resemblyzer.audio import normalize_volume, int16_max
+from resemblyzer.hparams import (audio_norm_target_dBFS, vad_window_length,
+                                 vad_moving_average_width, vad_max_silence_length)
 from pathlib import Path
+import soundfile as sf
+from resampling import resample
 from spectralcluster import SpectralClusterer, RefinementOptions
+import instrumentation
+
+# ===== Embedding / clustering parameters =====
+RATE = 16                 # partial embeddings per second
+MIN_COVERAGE = 0.75       # minimum coverage of the last partial window
+GAUSSIAN_BLUR_SIGMA = 1   # affinity refinement (spectralcluster RefinementOptions)
+P_PERCENTILE = 0.5
 
 def del_sub_dir(pathsub, dirname):
     folder = os.path.join(pathsub, dirname)
@@ -35,22 +51,153 @@ def create_labelling(labels, wav_splits):
 
     return labelling
 
-def diar(fpath, spk_num):
-    audio_file_path = fpath
-    wav_fpath = Path(audio_file_path)
+def load_wav(fpath):
+    """
+    Decode a file to mono float32 at 16 kHz, skipping resampling when it is already 16 kHz.
+    Returns None if soundfile cannot decode the format.
+    """
+    try:
+        wav, sr = sf.read(str(fpath), dtype='float32')
+    except RuntimeError:
+        return None
+    if wav.ndim > 1:
+        wav = wav.mean(axis=1)
+    return resample(wav, sr, 16000).astype('float32', copy=False)
+
+def load_regions(fpath, regions):
+    """
+    Decode only the given [start, end) second regions of a file to mono 16 kHz.
+    Returns (wav, spans): the concatenated chunks and each chunk's [start, stop)
+    sample position on the original 16 kHz timeline.
+    """
+    chunks, spans = [], []
+    with sf.SoundFile(str(fpath)) as f:
+        sr = f.samplerate
+        for start, end in regions:
+            f.seek(int(start * sr))
+            chunk = f.read(int(end * sr) - int(start * sr), dtype='float32', always_2d=True).mean(axis=1)
+            chunk = resample(chunk, sr, 16000).astype('float32', copy=False)
+            a = int(round(start * 16000))
+            chunks.append(chunk)
+            spans.append((a, a + len(chunk)))
+    wav = np.concatenate(chunks) if chunks else np.zeros(0, dtype='float32')
+    return wav, np.array(spans, dtype=int).reshape(-1, 2)
+
+def compose_runs(runs, spans):
+    """
+    Re-express runs found on a signal made of concatenated chunks (see load_regions)
+    on the original timeline, splitting runs that cross a chunk boundary.
+    """
+    offsets = np.concatenate(([0], np.cumsum(spans[:, 1] - spans[:, 0])))
+    out = []
+    for a, b in runs:
+        i = np.searchsorted(offsets, a, side='right') - 1
+        while a < b and i < len(spans):
+            stop = min(b, offsets[i + 1])
+            out.append((spans[i, 0] + a - offsets[i], spans[i, 0] + stop - offsets[i]))
+            a = stop
+            i += 1
+    return np.array(out, dtype=int).reshape(-1, 2)
+
+def speech_runs(wav):
+    """
+    Same voice detection as resemblyzer's trim_long_silences, but returns the kept
+    regions as an (n, 2) array of [start, stop) sample indices instead of the trimmed wav.
+    """
+    samples_per_window = (vad_window_length * 16000) // 1000
+    n_windows = len(wav) // samples_per_window
+    pcm_wave = np.round(wav[:n_windows * samples_per_window] * int16_max).astype('<i2').tobytes()
+
+    vad = webrtcvad.Vad(mode=3)
+    step = samples_per_window * 2
+    voice_flags = np.array([vad.is_speech(pcm_wave[w * step:(w + 1) * step], sample_rate=16000)
+                            for w in range(n_windows)], dtype=float)
+
+    width = vad_moving_average_width
+    padded = np.concatenate((np.zeros((width - 1) // 2), voice_flags, np.zeros(width // 2)))
+    avg = np.cumsum(padded)
+    avg[width:] = avg[width:] - avg[:-width]
+    mask = np.round(avg[width - 1:] / width).astype(bool)
+    mask = binary_dilation(mask, np.ones(vad_max_silence_length + 1))
+
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    stops = np.flatnonzero(edges == -1)
+    return np.stack((starts, stops), axis=1) * samples_per_window
+
+def apply_runs(wav, runs):
+    return np.concatenate([wav[a:b] for a, b in runs]) if len(runs) else wav[:0]
+
+def trim_silences(wav):
+    """
+    Volume-normalise and drop long silences as resemblyzer's preprocess_wav does.
+    Returns (trimmed wav, runs) with runs on the timeline of the input.
+    """
+    wav = normalize_volume(wav, audio_norm_target_dBFS, increase_only=True)
+    runs = speech_runs(wav)
+    return apply_runs(wav, runs), runs
+
+def map_span(runs, start, end, sampling_rate=16000):
+    """
+    Map [start, end) seconds on the silence-trimmed timeline back to a list of
+    [a, b) sample ranges of the original 16 kHz signal.
+    """
+    lengths = runs[:, 1] - runs[:, 0]
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    p0, p1 = int(start * sampling_rate), int(end * sampling_rate)
+    first = max(0, np.searchsorted(offsets, p0, side='right') - 1)
+    last = np.searchsorted(offsets, p1, side='left')
+    ranges = []
+    for r in range(first, min(last, len(runs))):
+        a = runs[r, 0] + max(p0 - offsets[r], 0)
+        b = runs[r, 0] + min(p1, offsets[r + 1]) - offsets[r]
+        if b > a:
+            ranges.append((int(a), int(b)))
+    return ranges
 
-    wav = preprocess_wav(wav_fpath)
+def embed_file(fpath, encoder=None, regions=None, rate=RATE, min_coverage=MIN_COVERAGE):
+    """
+    Decode, trim silences and compute partial embeddings for a file.
+    regions (seconds, from speech_detect.speech_regions) limits decoding and
+    everything after it to those spans.
+    Returns (wav, runs, cont_embeds, wav_splits); runs are the kept [start, stop)
+    regions of the original 16 kHz signal.
+    """
+    wav_fpath = Path(fpath)
+
+    spans = None
+    with instrumentation.stage('diar_decode') as st:
+        if regions is not None:
+            wav, spans = load_regions(wav_fpath, regions)
+        else:
+            wav = load_wav(wav_fpath)
+            if wav is None:
+                # formats soundfile cannot read: decode with librosa, as resemblyzer does
+                wav = librosa.load(str(wav_fpath), sr=16000)[0]
+        st.audio_seconds = len(wav) / 16000
+    with instrumentation.stage('vad') as st:
+        wav, runs = trim_silences(wav)
+        if spans is not None:
+            runs = compose_runs(runs, spans)
+        st.audio_seconds = len(wav) / 16000
     if len(wav) == 0:
-        return [], []
+        return wav, runs, [], []
 
-    encoder = VoiceEncoder("cpu")
-    _, cont_embeds, wav_splits = encoder.embed_utterance(
-        wav, return_partials=True, rate=16, min_coverage=0.75
-    )
+    if encoder is None:
+        with instrumentation.stage('load_encoder'):
+            encoder = VoiceEncoder("cpu")
+    with instrumentation.stage('embed', len(wav) / 16000):
+        _, cont_embeds, wav_splits = encoder.embed_utterance(
+            wav, return_partials=True, rate=rate, min_coverage=min_coverage
+        )
+    instrumentation.add('embeddings', len(cont_embeds))
+    return wav, runs, cont_embeds, wav_splits
 
+def cluster_labels(cont_embeds, spk_num, gaussian_blur_sigma=GAUSSIAN_BLUR_SIGMA,
+                   p_percentile=P_PERCENTILE):
     refinement = RefinementOptions(
-        gaussian_blur_sigma=1,
-        p_percentile=0.5
+        gaussian_blur_sigma=gaussian_blur_sigma,
+        p_percentile=p_percentile
     )
 
     clusterer = SpectralClusterer(
@@ -59,7 +206,33 @@ def diar(fpath, spk_num):
         refinement_options=refinement
     )
 
-    labels = clusterer.predict(cont_embeds)
-    labelling = create_labelling(labels, wav_splits)
+    with instrumentation.stage('cluster'):
+        labels = clusterer.predict(cont_embeds)
+    return labels
+
+def speaker_centroids(cont_embeds, labels):
+    """
+    One L2-normalised centroid per speaker label: {'spk0': (centroid, n_partials), ...}
+    """
+    labels = np.asarray(labels)
+    centroids = {}
+    for label in np.unique(labels):
+        members = cont_embeds[labels == label]
+        centroid = members.mean(axis=0)
+        centroids[f'spk{label}'] = (centroid / np.linalg.norm(centroid), len(members))
+    return centroids
+
+def cluster_embeddings(cont_embeds, wav_splits, spk_num):
+    labels = cluster_labels(cont_embeds, spk_num)
+    with instrumentation.stage('labelling'):
+        labelling = create_labelling(labels, wav_splits)
+    instrumentation.add('segments', len(labelling))
+    return labelling
+
+def diar(fpath, spk_num, encoder=None):
+    wav, _, cont_embeds, wav_splits = embed_file(fpath, encoder)
+    if len(wav) == 0:
+        return [], []
 
+    labelling = cluster_embeddings(cont_embeds, wav_splits, spk_num)
     return labelling, wav
@@ -0,0 +1,386 @@
+import os
+import json
+import time
+import itertools
+import numpy as np
+import soundfile as sf
+from scipy.optimize import linear_sum_assignment
+from scipy.signal import resample_poly
+
+from diarization import load_wav, embed_file, cluster_labels, create_labelling, map_span
+from speech_detect import speech_regions
+from mypredict_imp import load_audio, count
+from cascade import cascade_count, eigengap, get_model
+
+# ===== Evaluation parameters =====
+FRAME = 0.01              # scoring resolution (seconds)
+COLLAR = 0.25             # seconds around reference boundaries that are not scored
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Examples')
+EXAMPLE_FILES = ['Test_4.wav', 'Test_5.wav']
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg', '.mp3')
+
+# ===== Synthetic set =====
+SYNTH_FILES = 20
+SYNTH_MAX_SPEAKERS = 4
+SYNTH_VOICES = ((7, 8), (1, 1), (8, 7))   # resample_poly (up, down): each source gives 3 voices
+TURN_SECONDS = (1.5, 4.0)
+GAP_SECONDS = (0.2, 1.0)
+TRIM_DB = 30              # turn excerpts are trimmed to frames within this of their peak
+
+# ===== Default configuration grid =====
+# count: 'oracle' (reference count), 'eigengap', 'model' or 'cascade'
+# ('model' and 'cascade' are dropped when the model file is missing)
+# count_window: 10 s the counting model sees, 'head' of the file or first 'speech'
+GRID = {
+    'rate': [16, 8],
+    'min_coverage': [0.75],
+    'gaussian_blur_sigma': [1],
+    'p_percentile': [0.5, 0.95],
+    'prepass': [False, True],
+    'count': ['eigengap', 'cascade'],
+    'count_window': ['head'],
+}
+MODEL_COUNTS = ('model', 'cascade')   # count modes that need the counting model
+
+
+# ===== Reference files =====
+
+def load_rttm(path):
+    """
+    Read SPEAKER lines of an RTTM file as a list of (speaker, start, end).
+    """
+    segments = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) >= 8 and fields[0] == 'SPEAKER':
+                start, duration = float(fields[3]), float(fields[4])
+                segments.append((fields[7], start, start + duration))
+    return segments
+
+
+def write_rttm(path, file_id, segments):
+    with open(path, 'w') as f:
+        for speaker, start, end in segments:
+            f.write(f"SPEAKER {file_id} 1 {start:.3f} {end - start:.3f} <NA> <NA> {speaker} <NA> <NA>\n")
+
+
+def load_set(set_dir):
+    """
+    Labelled set: every audio file in set_dir with an RTTM file of the same name.
+    Returns a list of (audio_path, reference segments).
+    """
+    dataset = []
+    for name in sorted(os.listdir(set_dir)):
+        base, ext = os.path.splitext(name)
+        rttm = os.path.join(set_dir, base + '.rttm')
+        if ext.lower() in AUDIO_EXTENSIONS and os.path.exists(rttm):
+            dataset.append((os.path.join(set_dir, name), load_rttm(rttm)))
+    return dataset
+
+
+def trim(clip, top_db=TRIM_DB, frame=320):
+    """
+    Cut leading and trailing frames more than top_db below the loudest frame.
+    """
+    n = len(clip) // frame
+    if n == 0:
+        return clip
+    energy_db = 10 * np.log10(np.mean(clip[:n * frame].reshape(n, frame) ** 2, axis=1) + 1e-12)
+    loud = np.flatnonzero(energy_db > energy_db.max() - top_db)
+    return clip[loud[0] * frame:(loud[-1] + 1) * frame]
+
+
+def build_synthetic(out_dir, n_files=SYNTH_FILES, max_speakers=SYNTH_MAX_SPEAKERS, seed=0, sources=None):
+    """
+    Write a labelled set of conversations stitched from the Examples clips.
+
+    Each source clip gives several voices by resampling it (pitch and tempo
+    shift); a file takes 1..max_speakers voices and alternates excerpts of them
+    with short pauses. A source clip counts as one voice even if it holds
+    several speakers, so the set is meant for comparing configurations rather
+    than for absolute DER figures.
+    """
+    rng = np.random.default_rng(seed)
+    if sources is None:
+        sources = [os.path.join(EXAMPLES_DIR, name) for name in EXAMPLE_FILES]
+    voices = []
+    for path in sources:
+        audio = load_wav(path)
+        for up, down in SYNTH_VOICES:
+            voices.append(resample_poly(audio, up, down).astype('float32') if up != down else audio)
+    max_speakers = min(max_speakers, len(voices))
+
+    os.makedirs(out_dir, exist_ok=True)
+    dataset = []
+    for i in range(n_files):
+        n_spk = int(rng.integers(1, max_speakers + 1))
+        chosen = rng.choice(len(voices), n_spk, replace=False)
+        turns = np.concatenate((chosen, rng.choice(chosen, int(rng.integers(n_spk, 3 * n_spk + 1)))))
+        rng.shuffle(turns)
+
+        pieces, reference, t = [], [], 0.0
+        for v in turns:
+            gap = np.zeros(int(rng.uniform(*GAP_SECONDS) * 16000), dtype='float32')
+            voice = voices[v]
+            n = min(len(voice), int(rng.uniform(*TURN_SECONDS) * 16000))
+            start = int(rng.integers(0, len(voice) - n + 1))
+            clip = trim(voice[start:start + n])
+            t += len(gap) / 16000
+            reference.append((f'spk{v}', t, t + len(clip) / 16000))
+            t += len(clip) / 16000
+            pieces.extend((gap, clip))
+        pieces.append(np.zeros(int(GAP_SECONDS[1] * 16000), dtype='float32'))
+
+        file_id = f'synth_{i:03d}'
+        path = os.path.join(out_dir, file_id + '.wav')
+        sf.write(path, np.concatenate(pieces), 16000, 'PCM_16')
+        write_rttm(os.path.join(out_dir, file_id + '.rttm'), file_id, reference)
+        dataset.append((path, reference))
+    return dataset
+
+
+# ===== Scoring =====
+
+def segments_to_matrix(segments, n_frames, frame=FRAME):
+    """
+    (n_frames, n_speakers) bool activity matrix from (speaker, start, end) segments,
+    built with one difference array per speaker (no per-frame loop).
+    """
+    names = sorted({str(s) for s, _, _ in segments})
+    if not names:
+        return np.zeros((n_frames, 0), dtype=bool)
+    column = {name: i for i, name in enumerate(names)}
+    speakers = np.array([column[str(s)] for s, _, _ in segments])
+    bounds = np.array([(a, b) for _, a, b in segments], dtype=float)
+    idx = np.clip(np.round(bounds / frame).astype(int), 0, n_frames)
+    diff = np.zeros((n_frames + 1, len(names)), dtype=np.int32)
+    np.add.at(diff, (idx[:, 0], speakers), 1)
+    np.add.at(diff, (idx[:, 1], speakers), -1)
+    return np.cumsum(diff[:-1], axis=0) > 0
+
+
+def collar_mask(reference, n_frames, collar=COLLAR, frame=FRAME):
+    """
+    True for frames that are scored, i.e. farther than collar from any reference boundary.
+    """
+    if collar <= 0 or not reference:
+        return np.ones(n_frames, dtype=bool)
+    bounds = np.array([t for _, a, b in reference for t in (a, b)])
+    idx = np.round(bounds / frame).astype(int)
+    c = int(round(collar / frame))
+    diff = np.zeros(n_frames + 1, dtype=np.int32)
+    np.add.at(diff, np.clip(idx - c, 0, n_frames), 1)
+    np.add.at(diff, np.clip(idx + c, 0, n_frames), -1)
+    return np.cumsum(diff[:-1]) == 0
+
+
+def score(reference, hypothesis, collar=COLLAR, frame=FRAME):
+    """
+    Frame-based diarization error components, in seconds, for one file.
+    Speakers are mapped one-to-one (Hungarian on overlap); errors per frame are
+    max(n_ref, n_hyp) - n_correct, split into miss, false alarm and confusion.
+    """
+    end = max([b for _, _, b in reference] + [b for _, _, b in hypothesis] + [0])
+    n_frames = int(np.ceil(end / frame))
+    keep = collar_mask(reference, n_frames, collar, frame)
+    ref = segments_to_matrix(reference, n_frames, frame)[keep]
+    hyp = segments_to_matrix(hypothesis, n_frames, frame)[keep]
+
+    n_ref = ref.sum(axis=1)
+    n_hyp = hyp.sum(axis=1)
+    correct = np.zeros(len(ref), dtype=int)
+    if ref.shape[1] and hyp.shape[1]:
+        overlap = ref.T.astype(np.float64) @ hyp.astype(np.float64)
+        rows, cols = linear_sum_assignment(-overlap)
+        correct = (ref[:, rows] & hyp[:, cols]).sum(axis=1)
+    return {
+        'total': n_ref.sum() * frame,
+        'miss': np.maximum(n_ref - n_hyp, 0).sum() * frame,
+        'false_alarm': np.maximum(n_hyp - n_ref, 0).sum() * frame,
+        'confusion': (np.minimum(n_ref, n_hyp) - correct).sum() * frame,
+    }
+
+
+def der(totals):
+    return (totals['miss'] + totals['false_alarm'] + totals['confusion']) / max(totals['total'], 1e-9)
+
+
+def hypothesis_segments(labelling, runs):
+    """
+    Map create_labelling() output from the silence-trimmed timeline back to file time.
+    """
+    return [(spk, a / 16000, b / 16000) for spk, start, end in labelling for a, b in map_span(runs, start, end)]
+
+
+# ===== Sweep =====
+
+def configs(grid):
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def timed(cache, key, func, *args, **kwargs):
+    """
+    Cached (result, seconds): configurations that share a stage reuse it but are still charged its time.
+    """
+    if key not in cache:
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        cache[key] = (result, time.perf_counter() - start)
+    return cache[key]
+
+
+def count_speakers(config, path, embedded, reference, count_regions, model_path):
+    mode = config['count']
+    if mode == 'oracle':
+        return len({s for s, _, _ in reference})
+    if mode == 'eigengap':
+        return eigengap(embedded[2], rate=config['rate'])[0]
+    if mode == 'model':
+        return int(count(load_audio(path, count_regions), get_model(model_path)))
+    return cascade_count(path, embedded, model_path, regions=count_regions, rate=config['rate'])[0]['count']
+
+
+def run_config(config, dataset, encoder, model_path='mymodel/speaker_model_fixed.h5',
+               collar=COLLAR, cache=None):
+    """
+    Run one configuration over the labelled set; returns its record.
+    """
+    cache = {} if cache is None else cache
+    if config['count'] in ('model', 'cascade'):
+        get_model(model_path)  # load once, outside the timings
+    totals = dict.fromkeys(('total', 'miss', 'false_alarm', 'confusion'), 0.0)
+    wall = audio_seconds = 0.0
+    correct_counts = 0
+    for path, reference in dataset:
+        audio_seconds += sf.info(path).duration
+        regions = None
+        if config['prepass'] or config['count_window'] == 'speech':
+            (regions, _), seconds = timed(cache, ('prepass', path), speech_regions, path)
+            wall += seconds
+        embedded, seconds = timed(cache, ('embed', path, config['prepass'], config['rate'], config['min_coverage']),
+                                  embed_file, path, encoder, regions if config['prepass'] else None,
+                                  config['rate'], config['min_coverage'])
+        wall += seconds
+
+        start = time.perf_counter()
+        wav, runs, cont_embeds, wav_splits = embedded
+        spk_num = count_speakers(config, path, embedded, reference,
+                                 regions if config['count_window'] == 'speech' else None, model_path)
+        hypothesis = []
+        if len(wav):
+            labels = cluster_labels(cont_embeds, min(spk_num, len(cont_embeds)),
+                                    config['gaussian_blur_sigma'], config['p_percentile'])
+            hypothesis = hypothesis_segments(create_labelling(labels, wav_splits), runs)
+        wall += time.perf_counter() - start
+
+        correct_counts += spk_num == len({s for s, _, _ in reference})
+        for key, value in score(reference, hypothesis, collar).items():
+            totals[key] += value
+
+    return {
+        'config': config,
+        'der': round(der(totals), 4),
+        'miss': round(totals['miss'] / max(totals['total'], 1e-9), 4),
+        'false_alarm': round(totals['false_alarm'] / max(totals['total'], 1e-9), 4),
+        'confusion': round(totals['confusion'] / max(totals['total'], 1e-9), 4),
+        'count_accuracy': round(correct_counts / max(len(dataset), 1), 4),
+        'files': len(dataset),
+        'audio_seconds': round(audio_seconds, 2),
+        'wall_seconds': round(wall, 3),
+        'speed': round(audio_seconds / max(wall, 1e-9), 2),
+    }
+
+
+def mark_pareto(records):
+    """
+    Flag records no other record beats on both speed (higher) and DER (lower).
+    """
+    for r in records:
+        r['pareto'] = not any(o['speed'] >= r['speed'] and o['der'] <= r['der'] and
+                              (o['speed'] > r['speed'] or o['der'] < r['der']) for o in records)
+    return records
+
+
+def plot_pareto(records, path):
+    """
+    Save a throughput-versus-DER chart (needs matplotlib); points are labelled by record index.
+    """
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        raise ImportError("The Pareto chart needs matplotlib: pip install matplotlib")
+    fig, ax = plt.subplots(figsize=(8, 5))
+    speed = np.array([r['speed'] for r in records])
+    errors = np.array([r['der'] for r in records])
+    front = np.array([r['pareto'] for r in records])
+    ax.scatter(speed[~front], errors[~front], c='grey', label='configuration')
+    order = np.argsort(speed[front])
+    ax.plot(speed[front][order], errors[front][order], 'o-', c='tab:red', label='Pareto front')
+    for i, (x, y) in enumerate(zip(speed, errors)):
+        ax.annotate(str(i), (x, y), textcoords='offset points', xytext=(4, 4), fontsize=8)
+    ax.set_xscale('log')
+    ax.set_xlabel('Throughput (x real time)')
+    ax.set_ylabel('DER')
+    ax.grid(True, which='both', alpha=0.3)
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+# ===== Run as standalone script =====
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Accuracy versus speed sweep over pipeline configurations')
+    parser.add_argument('set', nargs='?', help='Labelled set: audio files with same-name .rttm files')
+    parser.add_argument('--synthetic', type=int, metavar='N',
+                        help='Build N synthetic files from the Examples clips into the set directory first')
+    parser.add_argument('--grid', help='JSON file {parameter: [values]} replacing the default grid')
+    parser.add_argument('--model', default='mymodel/speaker_model_fixed.h5', help='Path to model file (.h5)')
+    parser.add_argument('--collar', type=float, default=COLLAR)
+    parser.add_argument('--output', default='evaluation.json', help='Where to save the records')
+    parser.add_argument('--plot', help='Save the Pareto chart to this image file')
+    args = parser.parse_args()
+
+    set_dir = args.set or 'eval_set'
+    if args.synthetic or not args.set:
+        dataset = build_synthetic(set_dir, args.synthetic or SYNTH_FILES)
+    else:
+        dataset = load_set(set_dir)
+    if not dataset:
+        raise SystemExit(f"No labelled files in {set_dir}")
+
+    grid = dict(GRID)
+    if args.grid:
+        with open(args.grid) as f:
+            grid.update(json.load(f))
+    if not os.path.exists(args.model):
+        skipped = [mode for mode in grid['count'] if mode in MODEL_COUNTS]
+        grid['count'] = [mode for mode in grid['count'] if mode not in MODEL_COUNTS]
+        if skipped:
+            print(f"Model file {args.model} not found, skipping count modes {skipped}.")
+        if not grid['count']:
+            raise SystemExit("No count mode left; use 'oracle' or 'eigengap' without the model")
+
+    from resemblyzer import VoiceEncoder
+    encoder = VoiceEncoder("cpu")
+    cache = {}
+    records = []
+    for i, config in enumerate(configs(grid)):
+        record = run_config(config, dataset, encoder, args.model, args.collar, cache)
+        records.append(record)
+        print(f"[{i:3d}] DER {record['der']:.3f}  count acc {record['count_accuracy']:.2f}  "
+              f"{record['speed']:8.1f}x  {json.dumps(config)}")
+    mark_pareto(records)
+
+    with open(args.output, 'w') as f:
+        json.dump(records, f, indent=2)
+    print("Pareto front:", [i for i, r in enumerate(records) if r['pareto']])
+    print(f"Saved {len(records)} records to {args.output}")
+    if args.plot:
+        plot_pareto(records, args.plot)
+        print(f"Saved chart to {args.plot}")
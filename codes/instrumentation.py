@@ -0,0 +1,300 @@
+import os
+import sys
+import json
+import time
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ===== Switches (environment) =====
+# DIAR_METRICS=1            enable per-stage metrics and structured log lines
+# DIAR_METRICS=path.prom    ... and write a Prometheus text exposition file on exit
+# DIAR_METRICS=path.json    ... or a JSON one
+# DIAR_PROFILE=dir          dump a cProfile .prof file per profiled call into dir
+# DIAR_TRACEMALLOC=1        track Python heap peaks with tracemalloc
+METRICS_ENV = 'DIAR_METRICS'
+PROFILE_ENV = 'DIAR_PROFILE'
+TRACEMALLOC_ENV = 'DIAR_TRACEMALLOC'
+
+logger = logging.getLogger('diarization.metrics')
+
+_enabled = False
+_export_path = None
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+
+
+class _NullStage:
+    """
+    Shared no-op stage returned while metrics are disabled, so instrumented code
+    pays only for one function call and a flag check.
+    """
+    __slots__ = ('audio_seconds',)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('name', 'audio_seconds', '_wall', '_cpu', '_rss')
+
+    def __init__(self, name, audio_seconds):
+        self.name = name
+        self.audio_seconds = audio_seconds
+
+    def __enter__(self):
+        self._rss = rss_bytes()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        _record(self.name, wall, cpu, self.audio_seconds or 0.0, self._rss, rss_bytes())
+        return False
+
+
+def rss_bytes():
+    """
+    Current resident set size in bytes, or None if unknown (no procfs and no psutil).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, AttributeError, ValueError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def peak_rss_bytes():
+    """
+    Process-wide resident set size high-water mark in bytes, or None if unknown
+    (no resource module and no psutil).
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    return getattr(info, 'peak_wset', info.rss)
+
+
+def enabled():
+    return _enabled
+
+
+def enable(export_path=None):
+    """
+    Turn metrics collection on. If export_path is given, the exposition file
+    is written there at interpreter exit (and on every flush()).
+    """
+    global _enabled, _export_path
+    _enabled = True
+    if export_path:
+        if _export_path is None:
+            atexit.register(flush)
+        _export_path = export_path
+    _setup_logger()
+
+
+def _setup_logger():
+    if not logger.handlers and not logging.getLogger().handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+    # the host may have configured logging at WARNING; records here are INFO
+    logger.setLevel(logging.INFO)
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def stage(name, audio_seconds=None):
+    """
+    Context manager timing one pipeline stage. The audio duration handled by the
+    stage can be passed up front or set on the returned object (st.audio_seconds = ...).
+    """
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name, audio_seconds)
+
+
+def add(name, value=1):
+    """
+    Increase a counter, e.g. the number of embeddings computed.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+    logger.info(json.dumps({'event': 'counter', 'name': name, 'value': value}))
+
+
+def _record(name, wall, cpu, audio_seconds, rss_start, rss_end):
+    # RSS change over the stage; the process-wide peak is only exported as one gauge
+    growth = None if rss_start is None or rss_end is None else rss_end - rss_start
+    with _lock:
+        st = _stages.setdefault(name, {
+            'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'audio_s': 0.0, 'max_rss_growth_bytes': 0
+        })
+        st['calls'] += 1
+        st['wall_s'] += wall
+        st['cpu_s'] += cpu
+        st['audio_s'] += audio_seconds
+        if growth is not None:
+            st['max_rss_growth_bytes'] = max(st['max_rss_growth_bytes'], growth)
+    record = {
+        'event': 'stage',
+        'stage': name,
+        'wall_s': round(wall, 4),
+        'cpu_s': round(cpu, 4),
+        'rss_mb': None if rss_end is None else round(rss_end / (1024 * 1024), 1),
+        'rss_growth_mb': None if growth is None else round(growth / (1024 * 1024), 1),
+    }
+    if audio_seconds:
+        record['audio_s'] = round(audio_seconds, 3)
+        record['audio_s_per_s'] = round(audio_seconds / wall, 2) if wall > 0 else None
+    logger.info(json.dumps(record))
+
+
+def snapshot():
+    """
+    Return the aggregated metrics as a plain dict.
+    """
+    with _lock:
+        stages = {name: dict(st) for name, st in _stages.items()}
+        counters = dict(_counters)
+    for st in stages.values():
+        st['audio_s_per_s'] = st['audio_s'] / st['wall_s'] if st['wall_s'] > 0 else 0.0
+    data = {'stages': stages, 'counters': counters, 'peak_rss_bytes': peak_rss_bytes()}
+    try:
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            data['tracemalloc_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+    except ImportError:
+        pass
+    return data
+
+
+def to_prometheus(data):
+    """
+    Render a snapshot in the Prometheus text exposition format.
+    """
+    lines = []
+    per_stage = [
+        ('diar_stage_calls_total', 'counter', 'calls'),
+        ('diar_stage_wall_seconds_total', 'counter', 'wall_s'),
+        ('diar_stage_cpu_seconds_total', 'counter', 'cpu_s'),
+        ('diar_stage_audio_seconds_total', 'counter', 'audio_s'),
+        ('diar_stage_audio_seconds_per_second', 'gauge', 'audio_s_per_s'),
+        ('diar_stage_max_rss_growth_bytes', 'gauge', 'max_rss_growth_bytes'),
+    ]
+    for metric, kind, key in per_stage:
+        lines.append(f'# TYPE {metric} {kind}')
+        for name, st in sorted(data['stages'].items()):
+            lines.append(f'{metric}{{stage="{name}"}} {st[key]}')
+    for name, value in sorted(data['counters'].items()):
+        metric = f'diar_{name}_total'
+        lines.append(f'# TYPE {metric} counter')
+        lines.append(f'{metric} {value}')
+    if data['peak_rss_bytes'] is not None:
+        lines.append('# TYPE diar_peak_rss_bytes gauge')
+        lines.append(f"diar_peak_rss_bytes {data['peak_rss_bytes']}")
+    if 'tracemalloc_peak_bytes' in data:
+        lines.append('# TYPE diar_tracemalloc_peak_bytes gauge')
+        lines.append(f"diar_tracemalloc_peak_bytes {data['tracemalloc_peak_bytes']}")
+    return '\n'.join(lines) + '\n'
+
+
+def export(path):
+    """
+    Write the current metrics to path, as JSON for *.json and Prometheus text otherwise.
+    """
+    data = snapshot()
+    if path.endswith('.json'):
+        content = json.dumps(data, indent=2)
+    else:
+        content = to_prometheus(data)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def flush():
+    if _enabled and _export_path:
+        export(_export_path)
+
+
+@contextmanager
+def profiled(name):
+    """
+    Opt-in cProfile / tracemalloc hook around a top-level call.
+    Does nothing unless DIAR_PROFILE or DIAR_TRACEMALLOC is set.
+    """
+    profile_dir = os.environ.get(PROFILE_ENV)
+    trace = os.environ.get(TRACEMALLOC_ENV) not in (None, '', '0')
+    if not profile_dir and not trace:
+        yield
+        return
+    _setup_logger()
+
+    profiler = None
+    if profile_dir:
+        import cProfile
+        os.makedirs(profile_dir, exist_ok=True)
+        profiler = cProfile.Profile()
+    if trace:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            out = os.path.join(profile_dir, f'{name}_{int(time.time() * 1000)}.prof')
+            profiler.dump_stats(out)
+            logger.info(json.dumps({'event': 'profile', 'name': name, 'path': out}))
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            logger.info(json.dumps({'event': 'tracemalloc', 'name': name, 'peak_bytes': peak}))
+
+
+# Enable from the environment at import time
+_env_value = os.environ.get(METRICS_ENV)
+if _env_value not in (None, '', '0'):
+    enable(None if _env_value == '1' else _env_value)
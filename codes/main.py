@@ -1,5 +1,4 @@
-from diarNS import run_diarization
-from mypredict_imp import predict_speaker_count
+from diarNS import diarize_file
 import tkinter as tk
 from tkinter import filedialog, messagebox
 
@@ -19,14 +18,9 @@ def main():
         return
 
     try:
-        # Predict speaker count
-        print("Predicting speaker count...")
-        num_speakers = predict_speaker_count(file_path)
-        print(f"Predicted speaker count: {num_speakers}")
-
-        # Run diarization
-        print("Running diarization...")
-        run_diarization(num_speakers, file_path)
+        # Speech pre-pass, speaker count, then diarization
+        record, _ = diarize_file(file_path)
+        print(f"Predicted speaker count: {record['count']} (decided by {record['stage']})")
         print("Diarization completed.")
 
     except Exception as e:
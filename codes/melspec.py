@@ -0,0 +1,151 @@
+import os
+import numpy as np
+import librosa
+from functools import lru_cache
+
+# ===== Default feature parameters (same as the speaker-counting model) =====
+SAMPLE_RATE = 16000
+N_FFT = 1024
+HOP_LENGTH = 256
+N_MELS = 64
+FMAX = 8000
+TOP_DB = 80.0
+CHUNK_FRAMES = 8192  # frames transformed per rfft call, bounds temporary memory
+
+# ===== Reference check =====
+# librosa >= 0.10 pads with pad_mode='constant' by default; older versions used
+# 'reflect', so the model's features (and this engine) only match from 0.10 on
+MIN_LIBROSA = (0, 10)
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Examples')
+EXAMPLE_FILES = ['Test_4.wav', 'Test_5.wav']
+MAX_DB_ERROR = 0.01  # largest accepted difference to librosa, in dB
+
+
+class MelEngine:
+    """
+    Batched log-Mel spectrogram extractor.
+
+    Equivalent to librosa.feature.melspectrogram(center=True, pad_mode='constant')
+    followed by librosa.power_to_db(top_db=80), but the Hann window and Mel
+    filterbank are built once and many equal-length signals are framed through a
+    strided view and transformed with a single numpy.fft.rfft call.
+    """
+
+    def __init__(self, sr=SAMPLE_RATE, n_fft=N_FFT, hop_length=HOP_LENGTH, n_mels=N_MELS,
+                 fmax=FMAX, top_db=TOP_DB, pad_mode='constant'):
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mels = n_mels
+        self.top_db = top_db
+        self.pad_mode = pad_mode
+        # periodic Hann, as scipy.signal.get_window('hann', n_fft) used by librosa
+        n = np.arange(n_fft)
+        self.window = (0.5 - 0.5 * np.cos(2 * np.pi * n / n_fft)).astype('float32')
+        self.mel_basis = librosa.filters.mel(
+            sr=sr, n_fft=n_fft, n_mels=n_mels, fmax=fmax
+        ).astype('float32').T  # (n_fft // 2 + 1, n_mels)
+
+    def n_frames(self, n_samples):
+        return 1 + n_samples // self.hop_length
+
+    def frames(self, signals):
+        """
+        Centre-pad a (batch, samples) array and return a read-only strided view of
+        shape (batch, n_frames, n_fft). No frame data is copied.
+        """
+        pad = self.n_fft // 2
+        padded = np.pad(signals, ((0, 0), (pad, pad)), mode=self.pad_mode)
+        windows = np.lib.stride_tricks.sliding_window_view(padded, self.n_fft, axis=-1)
+        return windows[:, ::self.hop_length, :]
+
+    def power(self, signals):
+        """
+        Mel power spectrogram of a (batch, samples) array, shape (batch, time, mels).
+        """
+        signals = np.asarray(signals, dtype='float32')
+        if signals.ndim == 1:
+            signals = signals[np.newaxis, :]
+        frames = self.frames(signals)
+        batch, n_frames, _ = frames.shape
+        out = np.empty((batch, n_frames, self.n_mels), dtype='float32')
+
+        # transform as many whole signals per call as fit in CHUNK_FRAMES
+        per_chunk = max(1, CHUNK_FRAMES // max(n_frames, 1))
+        for start in range(0, batch, per_chunk):
+            stop = min(start + per_chunk, batch)
+            spec = np.fft.rfft(frames[start:stop] * self.window, n=self.n_fft, axis=-1)
+            mag = (spec.real ** 2 + spec.imag ** 2).astype('float32')
+            np.matmul(mag, self.mel_basis, out=out[start:stop])
+        return out
+
+    def __call__(self, signals):
+        """
+        Log-Mel spectrogram in dB of a (batch, samples) array, float32 (batch, time, mels).
+        """
+        mel = self.power(signals)
+        np.maximum(mel, 1e-10, out=mel)
+        db = 10.0 * np.log10(mel)
+        if self.top_db is not None:
+            floor = db.max(axis=(1, 2), keepdims=True) - self.top_db
+            np.maximum(db, floor, out=db)
+        return db.astype('float32', copy=False)
+
+
+@lru_cache(maxsize=8)
+def get_engine(sr=SAMPLE_RATE, n_fft=N_FFT, hop_length=HOP_LENGTH, n_mels=N_MELS,
+               fmax=FMAX, top_db=TOP_DB):
+    """
+    Shared MelEngine per parameter set, so the filterbank is built once per process.
+    """
+    return MelEngine(sr, n_fft, hop_length, n_mels, fmax, top_db)
+
+
+def librosa_version():
+    return tuple(int(part) for part in librosa.__version__.split('.')[:2])
+
+
+def reference_mel(audio, sr=SAMPLE_RATE, n_fft=N_FFT, hop_length=HOP_LENGTH, n_mels=N_MELS,
+                  fmax=FMAX, top_db=TOP_DB):
+    """
+    The librosa features MelEngine replaces, shape (time, mels).
+    """
+    mel_spec = librosa.feature.melspectrogram(
+        y=audio, sr=sr, n_fft=n_fft, hop_length=hop_length, n_mels=n_mels, fmax=fmax
+    )
+    return librosa.power_to_db(mel_spec, top_db=top_db).T
+
+
+def check_against_librosa(paths):
+    """
+    Largest absolute difference in dB between MelEngine and reference_mel on each
+    file (decoded to mono 16 kHz). Returns {path: max_abs_db}.
+    """
+    engine = get_engine()
+    errors = {}
+    for path in paths:
+        audio = librosa.load(path, sr=SAMPLE_RATE)[0]
+        errors[path] = float(np.max(np.abs(engine(audio)[0] - reference_mel(audio))))
+    return errors
+
+
+# ===== Run as standalone script =====
+if __name__ == '__main__':
+    import sys
+    import argparse
+    parser = argparse.ArgumentParser(description='Check MelEngine output against librosa')
+    parser.add_argument('files', nargs='*', help='Audio files (default: the Examples recordings)')
+    parser.add_argument('--max-error', type=float, default=MAX_DB_ERROR, help='Accepted difference in dB')
+    args = parser.parse_args()
+
+    if librosa_version() < MIN_LIBROSA:
+        print(f"librosa {librosa.__version__} pads with 'reflect'; MelEngine matches librosa "
+              f">= {'.'.join(map(str, MIN_LIBROSA))} only.")
+        sys.exit(1)
+    paths = args.files or [os.path.join(EXAMPLES_DIR, name) for name in EXAMPLE_FILES]
+    failed = False
+    for path, error in check_against_librosa(paths).items():
+        ok = error <= args.max_error
+        failed = failed or not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {os.path.basename(path)}: max |diff| {error:.5f} dB")
+    sys.exit(1 if failed else 0)
@@ -1,9 +1,10 @@
 import numpy as np
 import soundfile as sf
 import os
-import librosa
 import time
-from tensorflow.keras.models import load_model
+import instrumentation
+from melspec import get_engine
+from resampling import resample
 
 # ===== Audio processing parameters =====
 SAMPLE_RATE = 16000
@@ -13,16 +14,35 @@ N_MELS = 64
 DURATION = 10  # in seconds
 FRAME_LENGTH = SAMPLE_RATE * DURATION
 
-def load_audio(path):
+def load_audio(path, regions=None):
     """
     Load an audio file, convert to mono if needed, resample to SAMPLE_RATE,
     and ensure it has exactly FRAME_LENGTH samples (padding or truncating as necessary).
+    If speech regions ([start, end) seconds) are given, only those spans are read.
     """
-    audio, sr = sf.read(path)
+    with instrumentation.stage('count_decode') as st:
+        with sf.SoundFile(path) as f:
+            sr = f.samplerate
+            # only the first DURATION seconds are used; decode just those plus a
+            # little margin so resampling has context at the cut
+            needed = int(np.ceil(FRAME_LENGTH * sr / SAMPLE_RATE)) + sr // 10
+            if regions is None:
+                audio = f.read(frames=needed)
+            else:
+                chunks, total = [], 0
+                for start, end in regions:
+                    f.seek(int(start * sr))
+                    chunks.append(f.read(frames=min(int((end - start) * sr), needed - total)))
+                    total += len(chunks[-1])
+                    if total >= needed:
+                        break
+                audio = np.concatenate(chunks) if chunks else np.zeros(0)
+        st.audio_seconds = len(audio) / sr
     if audio.ndim > 1:
         audio = np.mean(audio, axis=1)  # convert to mono
     if sr != SAMPLE_RATE:
-        audio = librosa.resample(audio, orig_sr=sr, target_sr=SAMPLE_RATE)
+        with instrumentation.stage('resample', len(audio) / sr):
+            audio = resample(audio, sr, SAMPLE_RATE)
     if len(audio) < FRAME_LENGTH:
         audio = np.pad(audio, (0, FRAME_LENGTH - len(audio)), 'constant')
     else:
@@ -34,16 +54,17 @@ def extract_mel(audio):
     Extract Mel-spectrogram features from the audio signal and convert to dB scale.
     Output shape: (time_steps, N_MELS)
     """
-    mel_spec = librosa.feature.melspectrogram(
-        y=audio,
-        sr=SAMPLE_RATE,
-        n_fft=N_FFT,
-        hop_length=HOP_LENGTH,
-        n_mels=N_MELS,
-        fmax=8000
-    )
-    mel_db = librosa.power_to_db(mel_spec).T
-    return mel_db.astype('float32')
+    return extract_mel_batch(audio[np.newaxis, :])[0]
+
+def extract_mel_batch(audios):
+    """
+    Extract Mel-spectrograms in dB for a batch of equal-length signals in one pass.
+    Output shape: (batch, time_steps, N_MELS)
+    """
+    engine = get_engine(SAMPLE_RATE, N_FFT, HOP_LENGTH, N_MELS, fmax=8000)
+    with instrumentation.stage('mel', np.size(audios) / SAMPLE_RATE):
+        mel_db = engine(audios)
+    return mel_db
 
 def count(audio, model):
     """
@@ -52,11 +73,23 @@ def count(audio, model):
     """
     mel = extract_mel(audio)
     X = mel[np.newaxis, ..., np.newaxis]  # add batch and channel dims
-    preds = model.predict(X, verbose=0)
+    with instrumentation.stage('count', len(audio) / SAMPLE_RATE):
+        preds = model.predict(X, verbose=0)
     count_pred = np.argmax(preds, axis=1)[0] + 1  # +1 because labels are 1–5
     return count_pred
 
-def predict_speaker_count(audio_path, model_path='mymodel/speaker_model_fixed.h5'):
+def count_batch(audios, model):
+    """
+    Predict speaker counts for several FRAME_LENGTH signals with a single model call.
+    Returns an integer array of counts (1-5).
+    """
+    mel = extract_mel_batch(np.stack(audios))
+    X = mel[..., np.newaxis]  # add channel dim
+    with instrumentation.stage('count', len(audios) * DURATION):
+        preds = model.predict(X, verbose=0)
+    return np.argmax(preds, axis=1) + 1
+
+def predict_speaker_count(audio_path, model_path='mymodel/speaker_model_fixed.h5', regions=None):
     """
     Load a model and predict the number of speakers in the given audio file.
     """
@@ -64,9 +97,15 @@ def predict_speaker_count(audio_path, model_path='mymodel/speaker_model_fixed.h5
     if not os.path.exists(model_path):
         raise FileNotFoundError(f"Model file {model_path} not found!")
     
-    model = load_model(model_path)
-    audio = load_audio(audio_path)
-    return count(audio, model)
+    # TensorFlow is imported only here, so the feature helpers above stay light to import
+    from tensorflow.keras.models import load_model
+    with instrumentation.profiled('predict_speaker_count'):
+        with instrumentation.stage('load_model'):
+            model = load_model(model_path)
+        audio = load_audio(audio_path, regions)
+        estimate = count(audio, model)
+    instrumentation.flush()
+    return estimate
 
 
 # ===== Run as standalone script =====
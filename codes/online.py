@@ -0,0 +1,306 @@
+import time
+import numpy as np
+import torch
+import soundfile as sf
+from collections import deque
+from scipy.optimize import linear_sum_assignment
+from resemblyzer import VoiceEncoder
+from resemblyzer.audio import wav_to_mel_spectrogram
+from resemblyzer.hparams import partials_n_frames, mel_window_step
+from spectralcluster import SpectralClusterer, RefinementOptions
+
+from resampling import StreamResampler
+import instrumentation
+
+# ===== Online diarization parameters =====
+SAMPLE_RATE = 16000
+MAX_SPEAKERS = 5          # the counting model predicts 1-5 speakers
+RATE = 16                 # partial embeddings per second, as in diar()
+LATENCY = 1.0             # max seconds of audio a labelled segment is held back
+THRESHOLD = 0.75          # cosine similarity needed to join an existing speaker
+HISTORY = 300             # embeddings kept for re-clustering (~19 s at RATE=16)
+RECLUSTER_EVERY = 64      # embeddings between two re-clusterings of the history
+MIN_RMS_DB = -45.0        # windows quieter than this are treated as silence
+
+HOP = SAMPLE_RATE * mel_window_step // 1000          # samples per mel frame
+WINDOW = partials_n_frames * HOP                      # samples per partial (1.6 s)
+
+
+def embed_frames(encoder, frames):
+    """
+    Embed a (batch, partials_n_frames, mel_n_channels) array of mel windows in one forward pass.
+    """
+    with torch.no_grad():
+        mels = torch.from_numpy(np.ascontiguousarray(frames, dtype='float32')).to(encoder.device)
+        return encoder(mels).cpu().numpy()
+
+
+class OnlineDiarizer:
+    """
+    Incremental speaker labelling for live audio.
+
+    Partial Resemblyzer embeddings are computed as soon as their 1.6 s window is
+    complete and assigned to the nearest speaker centroid (or a new speaker, up to
+    max_speakers). Every recluster_every embeddings the bounded history is
+    re-clustered with SpectralClusterer and the centroids are re-anchored to it.
+    Labelled segments ('spk', start, end) are emitted at least every `latency`
+    seconds of audio, so the end-to-end delay is about latency + half a window.
+    """
+
+    def __init__(self, encoder=None, max_speakers=MAX_SPEAKERS, sr=SAMPLE_RATE, rate=RATE,
+                 latency=LATENCY, threshold=THRESHOLD, history=HISTORY,
+                 recluster_every=RECLUSTER_EVERY, min_rms_db=MIN_RMS_DB):
+        self.encoder = encoder if encoder is not None else VoiceEncoder("cpu")
+        self.max_speakers = max_speakers
+        self.latency = latency
+        self.threshold = threshold
+        self.recluster_every = recluster_every
+        self.min_rms_db = min_rms_db
+        # frame step rounded to whole mel frames, as resemblyzer's compute_partial_slices
+        self.step = max(1, int(np.round((SAMPLE_RATE / rate) / HOP))) * HOP
+        self.resampler = StreamResampler(sr, SAMPLE_RATE)
+        self.history = deque(maxlen=history)
+        self.centroids = []  # running (unnormalised) sums of member embeddings
+        self.reset_stream()
+
+    def reset_stream(self):
+        self._buf = np.zeros(0, dtype='float32')
+        self._buf_start = 0
+        self._next_window = 0
+        self._since_recluster = 0
+        self._open = None        # [speaker, start, end] of the segment being built
+        self._emitted_until = 0.0
+
+    # ----- embedding -----
+
+    def _ready_windows(self):
+        received = self._buf_start + len(self._buf)
+        last = (received - WINDOW) // self.step
+        return range(self._next_window, last + 1) if last >= self._next_window else range(0)
+
+    def _embed(self, windows):
+        """
+        Embed the given window indices with one mel pass over their span and one
+        batched encoder forward pass. Returns (centre_times, embeddings) of non-silent windows.
+        """
+        first = windows[0] * self.step - self._buf_start
+        last = windows[-1] * self.step - self._buf_start + WINDOW
+        span = self._buf[first:last]
+        mel = wav_to_mel_spectrogram(span)
+        starts = [(k * self.step - self._buf_start - first) // HOP for k in windows]
+        frames = np.array([mel[s:s + partials_n_frames] for s in starts])
+
+        rms = np.array([np.sqrt(np.mean(self._buf[k * self.step - self._buf_start:][:WINDOW] ** 2))
+                        for k in windows])
+        voiced = 20 * np.log10(rms + 1e-10) > self.min_rms_db
+        times = np.array([(k * self.step + WINDOW / 2) / SAMPLE_RATE for k in windows])
+        if not voiced.any():
+            return times, voiced, np.zeros((0, 0))
+        with instrumentation.stage('online_embed', voiced.sum() * self.step / SAMPLE_RATE):
+            embeds = embed_frames(self.encoder, frames[voiced])
+        instrumentation.add('embeddings', int(voiced.sum()))
+        return times, voiced, embeds
+
+    # ----- speaker assignment -----
+
+    def _normalised_centroids(self):
+        c = np.array(self.centroids)
+        return c / np.linalg.norm(c, axis=1, keepdims=True)
+
+    def _assign(self, embed):
+        if not self.centroids:
+            self.centroids.append(embed.copy())
+            return 0
+        sims = self._normalised_centroids() @ embed
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold and len(self.centroids) < self.max_speakers:
+            self.centroids.append(embed.copy())
+            return len(self.centroids) - 1
+        self.centroids[best] += embed
+        return best
+
+    def _recluster(self):
+        """
+        Spectral clustering over the history window; clusters are matched to the
+        existing speakers (Hungarian on centroid similarity) and their centroids
+        replaced by the cluster means.
+        """
+        embeds = np.array([e for e, _ in self.history])
+        if len(embeds) < 2 * self.max_speakers:
+            return
+        clusterer = SpectralClusterer(
+            min_clusters=1,
+            max_clusters=min(self.max_speakers, len(self.centroids) + 1),
+            refinement_options=RefinementOptions(gaussian_blur_sigma=1, p_percentile=0.5)
+        )
+        try:
+            with instrumentation.stage('online_recluster'):
+                labels = clusterer.predict(embeds)
+        except Exception:
+            return  # too few / degenerate samples, keep the incremental state
+
+        clusters = np.unique(labels)
+        means = np.array([embeds[labels == c].mean(axis=0) for c in clusters])
+        means /= np.linalg.norm(means, axis=1, keepdims=True)
+        rows, cols = linear_sum_assignment(-(means @ self._normalised_centroids().T))
+        mapping = dict(zip(rows, cols))
+        for i, c in enumerate(clusters):
+            n = int((labels == c).sum())
+            if i in mapping:
+                self.centroids[mapping[i]] = means[i] * n
+            elif len(self.centroids) < self.max_speakers:
+                self.centroids.append(means[i] * n)
+
+    # ----- segments -----
+
+    def _label(self, t, speaker, out):
+        if self._open is None:
+            self._open = [speaker, self._emitted_until, t]
+        elif self._open[0] != speaker:
+            self._open[2] = t
+            out.append((str(self._open[0]), self._open[1], t))
+            self._emitted_until = t
+            self._open = [speaker, t, t]
+        else:
+            self._open[2] = t
+        if t - self._open[1] >= self.latency:
+            out.append((str(speaker), self._open[1], t))
+            self._emitted_until = t
+            self._open = [speaker, t, t]
+
+    def _silence(self, t, out):
+        if self._open is not None and self._open[2] > self._open[1]:
+            out.append((str(self._open[0]), self._open[1], self._open[2]))
+        self._open = None
+        self._emitted_until = t
+
+    # ----- public API -----
+
+    def feed(self, block):
+        """
+        Push a block of audio at the input rate; return the segments that are now final.
+        """
+        block = np.asarray(block, dtype='float32')
+        if block.ndim > 1:
+            block = block.mean(axis=1)
+        block = self.resampler.process(block).astype('float32', copy=False)
+        self._buf = np.concatenate((self._buf, block))
+        return self._drain()
+
+    def _drain(self):
+        out = []
+        windows = self._ready_windows()
+        if len(windows) == 0:
+            return out
+        times, voiced, embeds = self._embed(windows)
+        e = iter(embeds)
+        for t, is_voiced in zip(times, voiced):
+            if not is_voiced:
+                self._silence(t, out)
+                continue
+            embed = next(e)
+            speaker = self._assign(embed)
+            self.history.append((embed, speaker))
+            self._label(t, speaker, out)
+            self._since_recluster += 1
+            if self._since_recluster >= self.recluster_every:
+                self._recluster()
+                self._since_recluster = 0
+
+        self._next_window = windows[-1] + 1
+        drop = self._next_window * self.step - self._buf_start
+        self._buf = self._buf[drop:]
+        self._buf_start += drop
+        return out
+
+    def close(self):
+        """
+        End of stream: flush the resampler and the open segment.
+        """
+        tail = self.resampler.flush().astype('float32', copy=False)
+        self._buf = np.concatenate((self._buf, tail))
+        out = self._drain()
+        if self._open is not None and self._open[2] > self._open[1]:
+            out.append((str(self._open[0]), self._open[1], self._open[2]))
+        self.reset_stream()
+        return out
+
+
+# ===== Audio sources =====
+
+def file_source(path, block_seconds=0.1, realtime=True):
+    """
+    Yield (block, sample_rate) from a file, paced at real time unless realtime=False.
+    """
+    with sf.SoundFile(path) as f:
+        sr = f.samplerate
+        start = time.monotonic()
+        played = 0
+        for block in f.blocks(blocksize=int(sr * block_seconds), dtype='float32'):
+            played += len(block)
+            if realtime:
+                delay = start + played / sr - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            yield block, sr
+
+
+def microphone_source(block_seconds=0.1, sr=SAMPLE_RATE, device=None):
+    """
+    Yield (block, sample_rate) from a live input device (needs the sounddevice package).
+    """
+    try:
+        import sounddevice as sd
+    except ImportError:
+        raise ImportError("Live capture needs the sounddevice package: pip install sounddevice")
+    import queue
+    blocks = queue.Queue()
+    with sd.InputStream(samplerate=sr, channels=1, dtype='float32', device=device,
+                        blocksize=int(sr * block_seconds),
+                        callback=lambda data, frames, t, status: blocks.put(data.copy())):
+        while True:
+            yield blocks.get(), sr
+
+
+def run_online(source, **options):
+    """
+    Diarize a (block, sample_rate) source, yielding ('spk', start, end) segments as they are final.
+    """
+    diarizer = None
+    for block, sr in source:
+        if diarizer is None:
+            diarizer = OnlineDiarizer(sr=sr, **options)
+        for segment in diarizer.feed(block):
+            yield segment
+    if diarizer is not None:
+        for segment in diarizer.close():
+            yield segment
+
+
+# ===== Run as standalone script =====
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Online speaker diarization of a live or replayed stream')
+    parser.add_argument('audio', nargs='?', help='Audio file to replay in real time (omit for microphone)')
+    parser.add_argument('--speakers', type=int, help='Maximum number of speakers')
+    parser.add_argument('--predict', action='store_true',
+                        help='Cap speakers at the count predicted for the file')
+    parser.add_argument('--model', default='mymodel/speaker_model_fixed.h5', help='Path to model file (.h5)')
+    parser.add_argument('--latency', type=float, default=LATENCY, help='Latency budget in seconds')
+    parser.add_argument('--fast', action='store_true', help='Replay the file as fast as possible')
+    args = parser.parse_args()
+
+    max_speakers = args.speakers or MAX_SPEAKERS
+    if args.predict and args.audio:
+        from mypredict_imp import predict_speaker_count
+        max_speakers = int(predict_speaker_count(args.audio, args.model))
+        print(f"Predicted speaker count: {max_speakers}")
+
+    if args.audio:
+        source = file_source(args.audio, realtime=not args.fast)
+    else:
+        source = microphone_source()
+
+    t0 = time.monotonic()
+    for spk, start, end in run_online(source, max_speakers=max_speakers, latency=args.latency):
+        print(f"[{time.monotonic() - t0:7.2f}s] SPK{spk} {start:7.2f} - {end:7.2f}")
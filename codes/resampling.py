@@ -0,0 +1,128 @@
+import math
+import numpy as np
+import librosa
+from functools import lru_cache
+from scipy.signal import firwin, resample_poly
+
+TARGET_SR = 16000
+# Input rates that go through the cached polyphase path; anything else falls back to librosa
+COMMON_RATES = (8000, 22050, 44100, 48000)
+OUT_CHUNK = 65536  # output samples computed per step in StreamResampler
+
+
+def ratio(orig_sr, target_sr=TARGET_SR):
+    """
+    Reduced (up, down) factors for a rate conversion, e.g. 48000 -> 16000 gives (1, 3).
+    """
+    g = math.gcd(int(orig_sr), int(target_sr))
+    return int(target_sr) // g, int(orig_sr) // g
+
+
+@lru_cache(maxsize=16)
+def design_filter(up, down):
+    """
+    Anti-aliasing low-pass FIR for an up/down conversion, designed once per rate pair.
+    Same design as scipy.signal.resample_poly's default (Kaiser, beta=5, 10 zero crossings).
+    The returned array is read-only and not yet scaled by up.
+    """
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    h = firwin(2 * half_len + 1, 1.0 / max_rate, window=('kaiser', 5.0))
+    h.setflags(write=False)
+    return h
+
+
+def resample(audio, orig_sr, target_sr=TARGET_SR):
+    """
+    Resample a 1-D signal to target_sr.
+    Returns the input unchanged when it is already at the target rate, uses polyphase
+    filtering with a cached filter for COMMON_RATES and librosa.resample otherwise.
+    """
+    if orig_sr == target_sr:
+        return audio
+    if orig_sr in COMMON_RATES:
+        up, down = ratio(orig_sr, target_sr)
+        return resample_poly(audio, up, down, window=design_filter(up, down))
+    return librosa.resample(audio, orig_sr=orig_sr, target_sr=target_sr)
+
+
+class StreamResampler:
+    """
+    Chunked polyphase resampler for streaming readers.
+
+    Feed blocks of any size with process() and call flush() at the end of the stream;
+    the concatenated outputs equal resample(whole_signal, orig_sr, target_sr) for the
+    polyphase rates. Only the last filter-length of input is kept between calls.
+    """
+
+    def __init__(self, orig_sr, target_sr=TARGET_SR):
+        self.orig_sr = orig_sr
+        self.target_sr = target_sr
+        self.up, self.down = ratio(orig_sr, target_sr)
+        self.passthrough = self.up == self.down == 1
+        if self.passthrough:
+            return
+
+        h = np.asarray(design_filter(self.up, self.down)) * self.up
+        self.half_len = (len(h) - 1) // 2
+        self.n_taps = -(-len(h) // self.up)
+        # bank[p, q] = h[p + q * up]: the taps applied for output phase p
+        padded = np.zeros(self.up * self.n_taps)
+        padded[:len(h)] = h
+        self.bank = padded.reshape(self.n_taps, self.up).T.copy()
+        self.reset()
+
+    def reset(self):
+        self._buf = np.zeros(0)
+        self._buf_start = 0  # absolute input index of _buf[0]
+        self._received = 0
+        self._emitted = 0
+
+    def _compute(self, j_end):
+        """
+        Produce outputs _emitted .. j_end-1 from the buffered input.
+        Input outside the buffer is zero (start and end of stream).
+        """
+        q = np.arange(self.n_taps)
+        ext = np.concatenate((np.zeros(self.n_taps), self._buf, np.zeros(self.n_taps)))
+        ext_start = self._buf_start - self.n_taps
+        out = []
+        for j0 in range(self._emitted, j_end, OUT_CHUNK):
+            j = np.arange(j0, min(j0 + OUT_CHUNK, j_end))
+            n = j * self.down + self.half_len
+            phase = n % self.up
+            idx = (n // self.up)[:, np.newaxis] - q[np.newaxis, :] - ext_start
+            out.append(np.einsum('jq,jq->j', self.bank[phase], ext[idx]))
+        self._emitted = j_end
+        # keep only the input still needed by the next output
+        keep_from = (self._emitted * self.down + self.half_len) // self.up - self.n_taps + 1
+        drop = min(max(0, keep_from - self._buf_start), len(self._buf))
+        self._buf = self._buf[drop:]
+        self._buf_start += drop
+        return np.concatenate(out) if out else np.zeros(0)
+
+    def process(self, block):
+        """
+        Push one block of input samples, return the output samples that are now final.
+        """
+        block = np.asarray(block, dtype='float64')
+        if self.passthrough:
+            return block
+        self._buf = np.concatenate((self._buf, block))
+        self._received += len(block)
+        # output j is final once its newest input sample (n // up) has arrived
+        j_end = (self._received * self.up - 1 - self.half_len) // self.down + 1
+        if j_end <= self._emitted:
+            return np.zeros(0)
+        return self._compute(j_end)
+
+    def flush(self):
+        """
+        Return the remaining outputs, treating the stream as ended, and reset.
+        """
+        if self.passthrough:
+            return np.zeros(0)
+        total = -(-self._received * self.up // self.down)
+        out = self._compute(total) if total > self._emitted else np.zeros(0)
+        self.reset()
+        return out
@@ -0,0 +1,408 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import threading
+from urllib.parse import urlsplit, parse_qs, quote
+from concurrent.futures import ThreadPoolExecutor
+from resemblyzer import VoiceEncoder
+from tensorflow.keras.models import load_model
+
+from mypredict_imp import load_audio, count_batch
+from diarNS import run_diarization
+
+# ===== Service parameters =====
+HOST = '127.0.0.1'
+PORT = 8765
+MAX_QUEUE = 16            # queued jobs before new submissions get 503
+WORKERS = 2               # concurrent diarization jobs (one warm encoder each)
+MAX_BATCH = 8             # speaker-count inferences merged into one predict call
+BATCH_WAIT = 0.05         # seconds to wait for more jobs before predicting
+DECODERS = 4              # threads decoding the counting window of a batch
+RETENTION = 3600          # seconds finished jobs (and their files) are kept
+MAX_UPLOAD = 512 * 1024 * 1024
+
+STATUS_TEXT = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+               409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error',
+               503: 'Service Unavailable'}
+
+
+class DiarizationService:
+    """
+    Job queue around the pipeline, in two stages:
+      1. a count stage takes up to max_batch queued jobs, decodes their counting
+         windows on its own threads and counts them with one model.predict call;
+      2. diarization workers take counted jobs from a second queue and run them in
+         a bounded thread pool whose threads keep their VoiceEncoder loaded.
+    Finished jobs and their files are dropped after `retention` seconds or on DELETE.
+    """
+
+    def __init__(self, model_path='mymodel/speaker_model_fixed.h5', work_dir='service_jobs',
+                 max_queue=MAX_QUEUE, workers=WORKERS, max_batch=MAX_BATCH, batch_wait=BATCH_WAIT,
+                 decoders=DECODERS, retention=RETENTION):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model file {model_path} not found!")
+        self.model_path = model_path
+        self.work_dir = work_dir
+        self.workers = workers
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.retention = retention
+        self.jobs = {}
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        # bounded too, so a diarization backlog stalls counting and new jobs get 503
+        self.counted = asyncio.Queue(maxsize=max_queue)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='diar')
+        self.decode_executor = ThreadPoolExecutor(max_workers=decoders, thread_name_prefix='decode')
+        # Keras model calls are serialised on their own thread
+        self.model_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='count')
+        self._local = threading.local()
+        self._tasks = []
+        self.model = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        os.makedirs(self.work_dir, exist_ok=True)
+        self.model = await loop.run_in_executor(self.model_executor, load_model, self.model_path)
+        self._tasks.append(asyncio.create_task(self._counter()))
+        self._tasks.append(asyncio.create_task(self._janitor()))
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.executor.shutdown(wait=False)
+        self.decode_executor.shutdown(wait=False)
+        self.model_executor.shutdown(wait=False)
+
+    def new_job_dir(self):
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = os.path.join(self.work_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        return job_id, job_dir
+
+    def submit(self, job_id, job_dir, audio_path):
+        """
+        Queue a job. Raises asyncio.QueueFull when the service is saturated.
+        """
+        job = {'id': job_id, 'status': 'queued', 'path': audio_path, 'output_dir': job_dir,
+               'submitted': time.time(), 'speakers': None, 'result': None, 'error': None}
+        self.queue.put_nowait(job)
+        self.jobs[job_id] = job
+        return job
+
+    def delete(self, job_id):
+        """
+        Forget a finished job and remove its directory. Returns False if it is still running.
+        """
+        job = self.jobs[job_id]
+        if job['status'] not in ('done', 'failed'):
+            return False
+        del self.jobs[job_id]
+        shutil.rmtree(job['output_dir'], ignore_errors=True)
+        return True
+
+    def evict_expired(self):
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.get('finished') is not None and now - job['finished'] > self.retention:
+                self.delete(job_id)
+
+    async def _janitor(self):
+        while True:
+            await asyncio.sleep(min(60, self.retention))
+            self.evict_expired()
+
+    def _encoder(self):
+        # one warm encoder per executor thread
+        if getattr(self._local, 'encoder', None) is None:
+            self._local.encoder = VoiceEncoder("cpu")
+        return self._local.encoder
+
+    def _diarize(self, job):
+        labels = run_diarization(job['speakers'], job['path'], self._encoder(), job['output_dir'])
+        return [{'speaker': f'spk{spk}', 'start': round(start, 3), 'end': round(end, 3)}
+                for spk, start, end in labels]
+
+    @staticmethod
+    def _fail(job, error):
+        job['status'] = 'failed'
+        job['error'] = str(error)
+        job['finished'] = time.time()
+
+    async def _next_batch(self):
+        """
+        Wait for one queued job, then take more for up to batch_wait seconds (max_batch in total).
+        """
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.batch_wait
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _counter(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            for job in batch:
+                job['status'] = 'counting'
+            audios = await asyncio.gather(
+                *(loop.run_in_executor(self.decode_executor, load_audio, job['path']) for job in batch),
+                return_exceptions=True)
+            decoded = []
+            for job, audio in zip(batch, audios):
+                if isinstance(audio, Exception):
+                    self._fail(job, audio)
+                else:
+                    decoded.append((job, audio))
+            if decoded:
+                try:
+                    counts = await loop.run_in_executor(self.model_executor, count_batch,
+                                                        [audio for _, audio in decoded], self.model)
+                except Exception as e:
+                    for job, _ in decoded:
+                        self._fail(job, e)
+                    decoded = []
+                    counts = []
+                for (job, _), n in zip(decoded, counts):
+                    job['speakers'] = int(n)
+                    job['status'] = 'counted'
+                    await self.counted.put(job)
+            for _ in batch:
+                self.queue.task_done()
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.counted.get()
+            try:
+                job['status'] = 'diarizing'
+                job['result'] = await loop.run_in_executor(self.executor, self._diarize, job)
+                job['status'] = 'done'
+                job['finished'] = time.time()
+            except Exception as e:
+                self._fail(job, e)
+            finally:
+                self.counted.task_done()
+
+
+# ===== Minimal HTTP/1.1 front end (stdlib only, works offline) =====
+
+def job_view(job):
+    return {k: job[k] for k in ('id', 'status', 'speakers', 'error', 'submitted') if k in job}
+
+
+async def send(writer, code, payload, headers=None):
+    body = json.dumps(payload).encode()
+    lines = [f'HTTP/1.1 {code} {STATUS_TEXT.get(code, "")}',
+             'Content-Type: application/json',
+             f'Content-Length: {len(body)}',
+             'Connection: close']
+    for key, value in (headers or {}).items():
+        lines.append(f'{key}: {value}')
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+    await writer.drain()
+
+
+async def handle(service, reader, writer):
+    try:
+        request_line = (await reader.readline()).decode('latin-1').strip()
+        if not request_line:
+            return
+        method, target, _ = request_line.split(' ', 2)
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            key, _, value = line.partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        url = urlsplit(target)
+        parts = [p for p in url.path.split('/') if p]
+        length = int(headers.get('content-length', 0))
+
+        if method == 'GET' and parts == ['health']:
+            await send(writer, 200, {'queued': service.queue.qsize(), 'counted': service.counted.qsize(),
+                                    'jobs': len(service.jobs)})
+
+        elif method == 'POST' and parts == ['jobs']:
+            if length > MAX_UPLOAD:
+                await send(writer, 413, {'error': 'upload too large'})
+                return
+            if service.queue.full():
+                await send(writer, 503, {'error': 'queue full'}, {'Retry-After': '5'})
+                return
+            body = await reader.readexactly(length) if length else b''
+            if headers.get('content-type', '').startswith('application/json'):
+                payload = json.loads(body or b'{}')
+                audio_path = payload.get('path') if isinstance(payload, dict) else None
+                if not isinstance(audio_path, str) or not os.path.isfile(audio_path):
+                    await send(writer, 400, {'error': 'missing or unknown path'})
+                    return
+                job_id, job_dir = service.new_job_dir()
+            else:
+                if not body:
+                    await send(writer, 400, {'error': 'empty upload'})
+                    return
+                job_id, job_dir = service.new_job_dir()
+                # job_dir is also the output root: keep the upload apart under a fixed
+                # name, taking only the extension (decoders go by it) from the client
+                filename = os.path.basename(parse_qs(url.query).get('filename', ['upload.wav'])[0])
+                os.makedirs(os.path.join(job_dir, 'input'), exist_ok=True)
+                audio_path = os.path.join(job_dir, 'input', 'upload' + os.path.splitext(filename)[1])
+                with open(audio_path, 'wb') as f:
+                    f.write(body)
+            try:
+                job = service.submit(job_id, job_dir, audio_path)
+            except asyncio.QueueFull:
+                await send(writer, 503, {'error': 'queue full'}, {'Retry-After': '5'})
+                return
+            await send(writer, 202, job_view(job))
+
+        elif method == 'DELETE' and len(parts) == 2 and parts[0] == 'jobs':
+            if parts[1] not in service.jobs:
+                await send(writer, 404, {'error': 'unknown job'})
+            elif not service.delete(parts[1]):
+                await send(writer, 409, job_view(service.jobs[parts[1]]))
+            else:
+                await send(writer, 200, {'id': parts[1], 'deleted': True})
+
+        elif method == 'GET' and len(parts) in (2, 3) and parts[0] == 'jobs':
+            job = service.jobs.get(parts[1])
+            if job is None:
+                await send(writer, 404, {'error': 'unknown job'})
+            elif len(parts) == 2:
+                await send(writer, 200, job_view(job))
+            elif parts[2] != 'result':
+                await send(writer, 404, {'error': 'not found'})
+            elif job['status'] == 'failed':
+                await send(writer, 500, job_view(job))
+            elif job['status'] != 'done':
+                await send(writer, 409, job_view(job))
+            else:
+                await send(writer, 200, dict(job_view(job), segments=job['result'],
+                                             output_dir=job['output_dir']))
+        else:
+            await send(writer, 404, {'error': 'not found'})
+    except (ValueError, asyncio.IncompleteReadError) as e:
+        await send(writer, 400, {'error': str(e)})
+    finally:
+        writer.close()
+
+
+async def serve(service, host=HOST, port=PORT, unix_path=None):
+    await service.start()
+    callback = lambda r, w: handle(service, r, w)
+    if unix_path:
+        server = await asyncio.start_unix_server(callback, path=unix_path)
+        print(f"Diarization service listening on {unix_path}")
+    else:
+        server = await asyncio.start_server(callback, host, port)
+        print(f"Diarization service listening on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+# ===== Localhost client =====
+
+def request(method, path, body=None, headers=None, host=HOST, port=PORT):
+    import http.client
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b'{}')
+    finally:
+        conn.close()
+
+
+def submit_file(audio_path, upload=True, host=HOST, port=PORT):
+    """
+    Submit a file (uploaded, or by path when the server shares the filesystem).
+    Returns (http_status, job).
+    """
+    if upload:
+        with open(audio_path, 'rb') as f:
+            data = f.read()
+        name = os.path.basename(audio_path)
+        return request('POST', f'/jobs?filename={quote(name)}', data,
+                       {'Content-Type': 'application/octet-stream'}, host, port)
+    body = json.dumps({'path': os.path.abspath(audio_path)})
+    return request('POST', '/jobs', body, {'Content-Type': 'application/json'}, host, port)
+
+
+def wait_result(job_id, poll=0.5, timeout=3600, host=HOST, port=PORT):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status, payload = request('GET', f'/jobs/{job_id}/result', host=host, port=port)
+        if status != 409:
+            return status, payload
+        time.sleep(poll)
+    raise TimeoutError(f"Job {job_id} did not finish in {timeout}s")
+
+
+# ===== Run as standalone script =====
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Local diarization service')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_serve = sub.add_parser('serve', help='Run the service')
+    p_serve.add_argument('--host', default=HOST)
+    p_serve.add_argument('--port', type=int, default=PORT)
+    p_serve.add_argument('--unix', help='Listen on this Unix socket instead of TCP')
+    p_serve.add_argument('--model', default='mymodel/speaker_model_fixed.h5', help='Path to model file (.h5)')
+    p_serve.add_argument('--work-dir', default='service_jobs', help='Where uploads and outputs are stored')
+    p_serve.add_argument('--workers', type=int, default=WORKERS)
+    p_serve.add_argument('--max-queue', type=int, default=MAX_QUEUE)
+    p_serve.add_argument('--max-batch', type=int, default=MAX_BATCH)
+    p_serve.add_argument('--batch-wait', type=float, default=BATCH_WAIT)
+    p_serve.add_argument('--decoders', type=int, default=DECODERS)
+    p_serve.add_argument('--retention', type=float, default=RETENTION,
+                         help='Seconds finished jobs and their files are kept')
+
+    p_submit = sub.add_parser('submit', help='Submit files to a running service and wait for results')
+    p_submit.add_argument('audio', nargs='+')
+    p_submit.add_argument('--host', default=HOST)
+    p_submit.add_argument('--port', type=int, default=PORT)
+    p_submit.add_argument('--by-path', action='store_true', help='Send paths instead of uploading')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        service = DiarizationService(args.model, args.work_dir, args.max_queue,
+                                     args.workers, args.max_batch, args.batch_wait,
+                                     args.decoders, args.retention)
+        try:
+            asyncio.run(serve(service, args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
+    else:
+        jobs = []
+        for path in args.audio:
+            status, job = submit_file(path, not args.by_path, args.host, args.port)
+            print(f"{path}: {status} {job}")
+            if status == 202:
+                jobs.append(job['id'])
+        for job_id in jobs:
+            status, result = wait_result(job_id, host=args.host, port=args.port)
+            print(json.dumps(result, indent=2))
@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import numpy as np
+
+# ===== Index parameters =====
+DIM = 256                 # Resemblyzer embedding size
+RATE = 16                 # partial embeddings per second used by diar()
+BLOCK = 65536             # rows scored per matrix product when scanning
+TRAIN_SAMPLE = 100000     # rows used to train the coarse partitions
+EMBEDDINGS_FILE = 'embeddings.f32'
+META_FILE = 'meta.jsonl'
+PARTITIONS_FILE = 'partitions.npz'
+
+
+def normalise(x):
+    x = np.asarray(x, dtype='float32')
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+def recording_key(path):
+    """
+    Recordings are stored by absolute path, so relative and absolute spellings match.
+    """
+    return os.path.abspath(path)
+
+
+def merge_topk(scores, rows, new_scores, new_rows, k):
+    """
+    Merge candidate (m, *) score/row arrays and keep the k best per query, sorted.
+    """
+    scores = np.concatenate((scores, new_scores), axis=1)
+    rows = np.concatenate((rows, new_rows), axis=1)
+    if scores.shape[1] > k:
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, keep, axis=1)
+        rows = np.take_along_axis(rows, keep, axis=1)
+    order = np.argsort(-scores, axis=1)
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+
+class SpeakerIndex:
+    """
+    Append-only store of one centroid embedding per diarized speaker.
+
+    Rows live in a raw float32 file (L2-normalised, memory-mapped for search) and
+    their metadata in a JSON-lines file with the same row order. An optional set
+    of coarse partitions (spherical k-means) limits a query to the n_probe
+    closest partitions; rows added after the partitions were built are always
+    scanned.
+    """
+
+    def __init__(self, path, dim=DIM):
+        self.path = path
+        self.dim = dim
+        os.makedirs(path, exist_ok=True)
+        self._emb_path = os.path.join(path, EMBEDDINGS_FILE)
+        self._meta_path = os.path.join(path, META_FILE)
+        self._part_path = os.path.join(path, PARTITIONS_FILE)
+        self.meta = []
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                self.meta = [json.loads(line) for line in f if line.strip()]
+        rows = os.path.getsize(self._emb_path) // (4 * dim) if os.path.exists(self._emb_path) else 0
+        # a crash between the two appends leaves extra rows or lines; ignore them
+        self.size = min(rows, len(self.meta))
+        self.meta = self.meta[:self.size]
+        self._matrix = None
+        self._partitions = None
+
+    def __len__(self):
+        return self.size
+
+    def matrix(self):
+        """
+        Read-only memory map of the (size, dim) embedding matrix.
+        """
+        if self.size == 0:
+            return np.zeros((0, self.dim), dtype='float32')
+        if self._matrix is None or len(self._matrix) != self.size:
+            self._matrix = np.memmap(self._emb_path, dtype='float32', mode='r', shape=(self.size, self.dim))
+        return self._matrix
+
+    def add(self, recording, centroids):
+        """
+        Append speakers of one recording. centroids is {'spk0': (vector, n_partials), ...}
+        as returned by diarization.speaker_centroids. Returns the new row ids, or the
+        existing ones if the recording is already indexed.
+        """
+        recording = recording_key(recording)
+        existing = [entry['row'] for entry in self.meta if entry['recording'] == recording]
+        if existing:
+            return existing
+        names = sorted(centroids)
+        if not names:
+            return []
+        vectors = normalise([centroids[name][0] for name in names])
+        with open(self._emb_path, 'r+b' if os.path.exists(self._emb_path) else 'wb') as f:
+            f.seek(self.size * self.dim * 4)
+            f.truncate()
+            f.write(vectors.tobytes())
+        added = time.time()
+        rows = list(range(self.size, self.size + len(names)))
+        lines = []
+        for row, name in zip(rows, names):
+            n_partials = int(centroids[name][1])
+            lines.append({'row': row, 'recording': recording, 'speaker': name,
+                          'partials': n_partials, 'seconds': round(n_partials / RATE, 2), 'added': added})
+        with open(self._meta_path, 'a') as f:
+            for line in lines:
+                f.write(json.dumps(line) + '\n')
+        self.meta.extend(lines)
+        self.size += len(names)
+        return rows
+
+    def find(self, recording, speaker):
+        recording = recording_key(recording)
+        for entry in self.meta:
+            if entry['recording'] == recording and entry['speaker'] == speaker:
+                return entry['row']
+        raise KeyError(f"{speaker} of {recording} is not in the index")
+
+    # ----- coarse partitions -----
+
+    def build_partitions(self, n_lists=None, iters=10, seed=0):
+        """
+        Train n_lists spherical k-means centroids (default ~sqrt(size)) and assign every row.
+        """
+        if self.size == 0:
+            return
+        X = self.matrix()
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(self.size)))
+        n_lists = min(n_lists, self.size)
+        rng = np.random.default_rng(seed)
+        train_rows = np.sort(rng.choice(self.size, min(self.size, TRAIN_SAMPLE), replace=False))
+        train = np.asarray(X[train_rows])
+        C = train[rng.choice(len(train), n_lists, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmax(train @ C.T, axis=1)
+            sums = np.zeros_like(C)
+            np.add.at(sums, assign, train)
+            empty = np.flatnonzero(~sums.any(axis=1))
+            sums[empty] = train[rng.choice(len(train), len(empty))]
+            C = normalise(sums)
+
+        assign = np.empty(self.size, dtype='int32')
+        for start in range(0, self.size, BLOCK):
+            assign[start:start + BLOCK] = np.argmax(X[start:start + BLOCK] @ C.T, axis=1)
+        np.savez(self._part_path, centroids=C, assign=assign)
+        self._partitions = None
+
+    def partitions(self):
+        if self._partitions is None and os.path.exists(self._part_path):
+            data = np.load(self._part_path)
+            assign = data['assign']
+            order = np.argsort(assign, kind='stable')
+            bounds = np.searchsorted(assign[order], np.arange(len(data['centroids']) + 1))
+            self._partitions = (data['centroids'], order, bounds, len(assign))
+        return self._partitions
+
+    # ----- search -----
+
+    def _scan(self, queries, k, rows=None):
+        m = len(queries)
+        scores = np.empty((m, 0), dtype='float32')
+        best = np.empty((m, 0), dtype='int64')
+        X = self.matrix()
+        n = self.size if rows is None else len(rows)
+        for start in range(0, n, BLOCK):
+            if rows is None:
+                block_rows = np.arange(start, min(start + BLOCK, n))
+                block = X[start:start + BLOCK]
+            else:
+                block_rows = rows[start:start + BLOCK]
+                block = X[block_rows]
+            block_scores = queries @ block.T
+            scores, best = merge_topk(scores, best, block_scores,
+                                      np.broadcast_to(block_rows, block_scores.shape), k)
+        return scores, best
+
+    def query(self, vectors, k=10, n_probe=None):
+        """
+        Cosine top-k for one or more query vectors.
+        With n_probe and built partitions, only the n_probe nearest partitions (plus
+        rows added since) are scanned. Returns (scores, rows), each of shape (m, <=k).
+        """
+        queries = normalise(np.atleast_2d(vectors))
+        parts = self.partitions() if n_probe else None
+        if parts is None:
+            return self._scan(queries, k)
+
+        C, order, bounds, covered = parts
+        tail = np.arange(covered, self.size)
+        probes = np.argsort(-(queries @ C.T), axis=1)[:, :n_probe]
+        all_scores, all_rows = [], []
+        for q, lists in zip(queries, probes):
+            rows = np.sort(np.concatenate([order[bounds[l]:bounds[l + 1]] for l in lists] + [tail]))
+            s, r = self._scan(q[np.newaxis], k, rows)
+            all_scores.append(s[0])
+            all_rows.append(r[0])
+        width = max((len(s) for s in all_scores), default=0)
+        scores = np.full((len(queries), width), -np.inf, dtype='float32')
+        rows = np.full((len(queries), width), -1, dtype='int64')
+        for i, (s, r) in enumerate(zip(all_scores, all_rows)):
+            scores[i, :len(s)] = s
+            rows[i, :len(r)] = r
+        return scores, rows
+
+    def results(self, scores, rows):
+        """
+        Attach metadata to one query's (scores, rows).
+        """
+        return [dict(self.meta[r], score=float(s)) for s, r in zip(scores, rows) if r >= 0]
+
+
+def index_file(index, file_path, spk_num=None, encoder=None):
+    """
+    Diarize a file and append its speaker centroids. The count comes from the cascade if not given.
+    """
+    from diarization import embed_file, cluster_labels, speaker_centroids
+    embedded = embed_file(file_path, encoder)
+    wav, _, cont_embeds, _ = embedded
+    if len(wav) == 0:
+        return []
+    if spk_num is None:
+        from cascade import cascade_count
+        spk_num = cascade_count(file_path, embedded)[0]['count']
+    labels = cluster_labels(cont_embeds, spk_num)
+    return index.add(file_path, speaker_centroids(cont_embeds, labels))
+
+
+# ===== Run as standalone script =====
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Cross-recording speaker index')
+    parser.add_argument('index', help='Index directory')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_add = sub.add_parser('add', help='Diarize recordings and add their speakers')
+    p_add.add_argument('audio', nargs='+')
+    p_add.add_argument('--speakers', type=int, help='Speaker count (default: cascaded count)')
+
+    p_build = sub.add_parser('build', help='Build coarse partitions for faster queries')
+    p_build.add_argument('--lists', type=int, help='Number of partitions (default sqrt(size))')
+
+    p_query = sub.add_parser('query', help='Find recordings with the same voice')
+    p_query.add_argument('recording', help='Recording already in the index, or any audio file with --file')
+    p_query.add_argument('--speaker', default='spk0', help='Speaker of the indexed recording')
+    p_query.add_argument('--file', action='store_true', help='Embed the whole file as the query voice')
+    p_query.add_argument('-k', type=int, default=10)
+    p_query.add_argument('--probe', type=int, help='Scan only this many partitions')
+    args = parser.parse_args()
+
+    index = SpeakerIndex(args.index)
+    if args.command == 'add':
+        from resemblyzer import VoiceEncoder
+        encoder = VoiceEncoder("cpu")
+        for path in args.audio:
+            rows = index_file(index, path, args.speakers, encoder)
+            print(f"{path}: {len(rows)} speakers added")
+    elif args.command == 'build':
+        index.build_partitions(args.lists)
+        print(f"Built partitions over {len(index)} speakers")
+    else:
+        if args.file:
+            from resemblyzer import VoiceEncoder, preprocess_wav
+            vector = VoiceEncoder("cpu").embed_utterance(preprocess_wav(args.recording))
+        else:
+            vector = index.matrix()[index.find(args.recording, args.speaker)]
+        scores, rows = index.query(vector, args.k, args.probe)
+        for hit in index.results(scores[0], rows[0]):
+            print(f"{hit['score']:.3f}  {hit['recording']}  {hit['speaker']}  ({hit['seconds']}s)")
@@ -0,0 +1,186 @@
+import numpy as np
+import soundfile as sf
+import instrumentation
+
+# ===== Pre-pass parameters =====
+FRAME_SECONDS = 0.02      # detector frame (non-overlapping)
+BLOCK_SECONDS = 2.0       # audio decoded per step while scanning a file
+MIN_SPEECH = 0.3          # drop detections shorter than this before padding (seconds)
+MERGE_GAP = 1.0           # join speech regions closer than this
+PAD = 0.3                 # widen every region by this on both sides
+
+
+class EnergyDetector:
+    """
+    Frame-level speech flags from log energy above an adaptive noise floor.
+    Detectors are stateful across blocks: call reset() between files.
+    """
+    name = 'energy'
+
+    def __init__(self, frame_seconds=FRAME_SECONDS, margin_db=9.0, abs_floor_db=-55.0,
+                 floor_rise_db=0.5):
+        self.frame_seconds = frame_seconds
+        self.margin_db = margin_db
+        self.abs_floor_db = abs_floor_db
+        self.floor_rise_db = floor_rise_db  # allowed noise-floor rise per block
+        self.reset()
+
+    def reset(self):
+        self._floor = None
+
+    @property
+    def lag_seconds(self):
+        """How late the flags are relative to the audio (causal smoothing)."""
+        return 0.0
+
+    def frame_length(self, sr):
+        return max(1, int(sr * self.frame_seconds))
+
+    def energy_gate(self, frames):
+        energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-12)
+        block_floor = np.percentile(energy_db, 10)
+        if self._floor is None:
+            self._floor = block_floor
+        else:
+            self._floor = min(self._floor + self.floor_rise_db, block_floor)
+        return energy_db > max(self._floor + self.margin_db, self.abs_floor_db)
+
+    def __call__(self, frames, sr):
+        """
+        frames: (n_frames, frame_length) mono samples. Returns a bool array (n_frames,).
+        """
+        return self.energy_gate(frames)
+
+
+class EnergyFluxDetector(EnergyDetector):
+    """
+    Energy gate combined with smoothed spectral flux over log band energies.
+    Speech changes its spectrum several times a second; hold tones, hum and
+    most steady music change far less, so they fail the flux test even when loud.
+    """
+    name = 'energy_flux'
+
+    def __init__(self, frame_seconds=FRAME_SECONDS, margin_db=9.0, abs_floor_db=-55.0,
+                 floor_rise_db=0.5, flux_threshold_db=1.5, smooth_seconds=0.4, n_bands=24, max_hz=4000,
+                 range_db=30.0):
+        super().__init__(frame_seconds, margin_db, abs_floor_db, floor_rise_db)
+        self.range_db = range_db
+        self.flux_threshold_db = flux_threshold_db
+        self.smooth = max(1, int(round(smooth_seconds / frame_seconds)))
+        self.n_bands = n_bands
+        self.max_hz = max_hz
+
+    @property
+    def lag_seconds(self):
+        return (self.smooth - 1) * self.frame_seconds / 2
+
+    def reset(self):
+        super().reset()
+        self._prev_bands = None
+        self._flux_tail = np.zeros(0)
+
+    def band_db(self, frames, sr):
+        n = frames.shape[1]
+        spec = np.abs(np.fft.rfft(frames * np.hanning(n), axis=1)) ** 2
+        n_bins = max(self.n_bands, min(spec.shape[1], int(self.max_hz * n / sr)))
+        edges = np.linspace(1, n_bins, self.n_bands + 1).astype(int)[:-1]
+        bands = 10 * np.log10(np.add.reduceat(spec[:, :n_bins], edges, axis=1) + 1e-10)
+        # limit the dynamic range so leakage in near-empty bands does not count as flux
+        return np.maximum(bands, bands.max(axis=1, keepdims=True) - self.range_db)
+
+    def __call__(self, frames, sr):
+        gate = self.energy_gate(frames)
+        bands = self.band_db(frames, sr)
+        prev = bands[:1] if self._prev_bands is None else self._prev_bands
+        flux = np.maximum(np.diff(np.vstack((prev, bands)), axis=0), 0).mean(axis=1)
+        self._prev_bands = bands[-1:]
+
+        # causal moving average, carrying the last smooth-1 values across blocks
+        history = np.concatenate((self._flux_tail, flux))
+        csum = np.cumsum(np.concatenate(([0.0], history)))
+        idx = np.arange(len(self._flux_tail), len(history))
+        lo = np.maximum(idx - self.smooth + 1, 0)
+        smoothed = (csum[idx + 1] - csum[lo]) / (idx + 1 - lo)
+        self._flux_tail = history[-(self.smooth - 1):] if self.smooth > 1 else np.zeros(0)
+        return gate & (smoothed > self.flux_threshold_db)
+
+
+DETECTORS = {
+    EnergyDetector.name: EnergyDetector,
+    EnergyFluxDetector.name: EnergyFluxDetector,
+}
+
+
+def get_detector(detector='energy_flux', **options):
+    """
+    Detector instance from a registry name, a class, or an existing instance.
+    Any callable (frames, sr) -> bool flags with a frame_length(sr) method can be plugged in.
+    """
+    if isinstance(detector, str):
+        return DETECTORS[detector](**options)
+    if isinstance(detector, type):
+        return detector(**options)
+    return detector
+
+
+def flags_to_regions(flags, frame_seconds, min_speech=MIN_SPEECH, merge_gap=MERGE_GAP,
+                     pad=PAD, duration=None, lag=0.0):
+    """
+    Turn per-frame speech flags into an (n, 2) array of [start, end) seconds.
+    """
+    edges = np.diff(np.concatenate(([0], flags.astype(np.int8), [0])))
+    regions = np.stack((np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)), axis=1) * frame_seconds
+    regions = regions - lag
+    # drop short detections before padding, so isolated onsets do not survive
+    regions = regions[regions[:, 1] - regions[:, 0] >= min_speech]
+    if len(regions) == 0:
+        return np.zeros((0, 2))
+    regions[:, 0] -= pad
+    regions[:, 1] += pad
+    np.clip(regions, 0, duration if duration is not None else np.inf, out=regions)
+    # merge regions separated by less than merge_gap
+    keep = np.concatenate(([True], regions[1:, 0] - regions[:-1, 1] >= merge_gap))
+    return np.stack((regions[keep, 0], np.maximum.reduceat(regions[:, 1], np.flatnonzero(keep))), axis=1)
+
+
+def speech_regions(path, detector='energy_flux', block_seconds=BLOCK_SECONDS, min_speech=MIN_SPEECH,
+                   merge_gap=MERGE_GAP, pad=PAD):
+    """
+    Scan a file block by block (constant memory, no resampling) and return
+    (regions, duration): the speech-region index as [start, end) seconds.
+    """
+    detector = get_detector(detector)
+    detector.reset()
+    with sf.SoundFile(path) as f, instrumentation.stage('prepass') as st:
+        sr = f.samplerate
+        duration = f.frames / sr
+        st.audio_seconds = duration
+        frame_len = detector.frame_length(sr)
+        blocksize = max(1, int(block_seconds * sr) // frame_len) * frame_len
+        flags = []
+        for block in f.blocks(blocksize=blocksize, dtype='float32', always_2d=True):
+            mono = block.mean(axis=1)
+            n = len(mono) // frame_len
+            if n == 0:
+                continue
+            flags.append(detector(mono[:n * frame_len].reshape(n, frame_len), sr))
+    flags = np.concatenate(flags) if flags else np.zeros(0, dtype=bool)
+    frame_seconds = frame_len / sr
+    regions = flags_to_regions(flags, frame_seconds, min_speech, merge_gap, pad, duration,
+                               getattr(detector, 'lag_seconds', 0.0))
+    return regions, duration
+
+
+# ===== Run as standalone script =====
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Speech-region pre-pass')
+    parser.add_argument('audio', help='Audio file')
+    parser.add_argument('--detector', default='energy_flux', choices=sorted(DETECTORS))
+    args = parser.parse_args()
+
+    regions, duration = speech_regions(args.audio, args.detector)
+    speech = float(np.sum(regions[:, 1] - regions[:, 0])) if len(regions) else 0.0
+    for start, end in regions:
+        print(f"{start:8.2f} - {end:8.2f}")
+    print(f"Speech: {speech:.1f}s of {duration:.1f}s ({100 * speech / max(duration, 1e-9):.0f}%)")
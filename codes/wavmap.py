@@ -0,0 +1,120 @@
+import struct
+import numpy as np
+
+# WAVE format codes handled without decoding
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class WavMap:
+    """
+    Memory-mapped view of an uncompressed (PCM / IEEE float) RIFF WAV file.
+
+    `raw` is a read-only uint8 memmap of shape (frames, block_align) over the data
+    chunk; slicing it gives zero-copy segment views that can be written straight
+    to another file with the same format.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(12)
+            if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+                raise ValueError(f"{path} is not a RIFF/WAVE file")
+            fmt = None
+            while True:
+                chunk = f.read(8)
+                if len(chunk) < 8:
+                    raise ValueError(f"{path} has no data chunk")
+                chunk_id, size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+                if chunk_id == b'fmt ':
+                    fmt = f.read(size)
+                    if size % 2:
+                        f.seek(1, 1)
+                elif chunk_id == b'data':
+                    data_offset, data_size = f.tell(), size
+                    break
+                else:
+                    f.seek(size + size % 2, 1)
+        if fmt is None or len(fmt) < 16:
+            raise ValueError(f"{path} has no usable fmt chunk")
+
+        self.fmt_chunk = fmt
+        (fmt_code, self.channels, self.samplerate, _,
+         self.block_align, self.bits) = struct.unpack('<HHIIHH', fmt[:16])
+        if fmt_code == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+            fmt_code = struct.unpack('<H', fmt[24:26])[0]  # first field of the SubFormat GUID
+        if fmt_code not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+            raise ValueError(f"{path} is not uncompressed PCM (format {fmt_code})")
+        self.format_code = fmt_code
+
+        self.frames = data_size // self.block_align
+        self.raw = np.memmap(path, dtype='u1', mode='r', offset=data_offset,
+                             shape=(self.frames, self.block_align))
+
+    @property
+    def duration(self):
+        return self.frames / self.samplerate
+
+    def segment(self, start, end):
+        """
+        Zero-copy raw view of frames [start, end).
+        """
+        return self.raw[max(0, start):min(end, self.frames)]
+
+
+def is_uncompressed_wav(path):
+    """
+    True if path is a WAV file WavMap can map.
+    """
+    try:
+        WavMap(path)
+    except (ValueError, OSError):
+        return False
+    return True
+
+
+class WavWriter:
+    """
+    Writes a WAV file with the same fmt chunk as a source WavMap by appending raw
+    frame blocks; sizes are patched into the header on close().
+    """
+
+    def __init__(self, path, like):
+        self.path = path
+        self.block_align = like.block_align
+        self.data_size = 0
+        self._file = open(path, 'wb')
+        fmt = like.fmt_chunk
+        self._file.write(b'RIFF' + b'\0\0\0\0' + b'WAVE')
+        self._file.write(b'fmt ' + struct.pack('<I', len(fmt)) + fmt + (b'\0' if len(fmt) % 2 else b''))
+        self._file.write(b'data' + b'\0\0\0\0')
+        self._data_size_pos = self._file.tell() - 4
+
+    def write(self, block):
+        """
+        Append a (frames, block_align) raw view; the bytes go to the file without conversion.
+        """
+        if len(block):
+            self._file.write(np.ascontiguousarray(block).data)
+            self.data_size += len(block) * self.block_align
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self.data_size % 2:
+            self._file.write(b'\0')
+        end = self._file.tell()
+        self._file.seek(self._data_size_pos)
+        self._file.write(struct.pack('<I', self.data_size))
+        self._file.seek(4)
+        self._file.write(struct.pack('<I', end - 8))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False